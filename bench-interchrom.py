@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# benchmark interchrom matching - bucket index vs. the double pyranges join it replaced
+# simulates translocation breakend pairs clustered in hotspots so many pairs match on one partner only
+
+import argparse,time
+import pandas as pd
+import numpy as np
+import pyranges as pr
+from utils import matchBreakends
+
+parser = argparse.ArgumentParser(description = 'Benchmark interchrom breakend pair matching')
+parser.add_argument('-n','--number-pairs', help = 'Number of simulated interchrom breakend pairs.  Default is 50000', required = False, dest = 'num', type = int, default = '50000')
+parser.add_argument('--slack', help = 'Allowance in bps for imperfect variant position comparisons.  Default is 200', required = False, dest = 'slack', type = int, default = '200')
+parser.add_argument('--hotspots', help = 'Number of breakend hotspots per chromosome.  Default is 20', required = False, dest = 'hotspots', type = int, default = '20')
+parser.add_argument('--seed', help = 'Random seed.  Default is 1', required = False, dest = 'seed', type = int, default = '1')
+args = parser.parse_args()
+
+# ** simulate interchrom paired BEs around shared hotspots **
+chroms = ['chr' + str(idx) for idx in range(1,23)]
+
+def simulate(num,centers,rng):
+    hotspots = centers.shape[1]
+    chrom1 = rng.integers(0,len(chroms),num)
+    chrom2 = (chrom1 + rng.integers(1,len(chroms),num)) % len(chroms)
+    pos1 = centers[chrom1,rng.integers(0,hotspots,num)] + rng.integers(-2000,2000,num)
+    pos2 = centers[chrom2,rng.integers(0,hotspots,num)] + rng.integers(-2000,2000,num)
+    return pd.DataFrame({'id':['sv' + str(idx) for idx in range(num)],'chrom1':[chroms[idx] for idx in chrom1],'pos1':pos1,
+                         'chrom2':[chroms[idx] for idx in chrom2],'pos2':pos2})
+# **
+
+# ** double join - each partner joined separately then the matchIDs intersected **
+def doubleJoin(df1,df2,slack):
+    df1b = df1.copy()
+    df1b['Start'] = df1b['pos1'] - 1; df1b['End'] = df1b['pos1']; df1b['Chromosome'] = df1b['chrom1']
+    df1c = df1.copy()
+    df1c['Start'] = df1c['pos2'] - 1; df1c['End'] = df1c['pos2']; df1c['Chromosome'] = df1c['chrom2']
+    df2b = df2.copy()
+    df2b['Start'] = df2b['pos1'] - 1; df2b['End'] = df2b['pos1']; df2b['Chromosome'] = df2b['chrom1']
+    df2c = df2.copy()
+    df2c['Start'] = df2c['pos2'] - 1; df2c['End'] = df2c['pos2']; df2c['Chromosome'] = df2c['chrom2']
+
+    dfMatch2 = pr.PyRanges(df1b).join(pr.PyRanges(df2b),slack = slack,report_overlap=True,how=None,preserve_order = True).df
+    dfMatch3 = pr.PyRanges(df1c).join(pr.PyRanges(df2c),slack = slack,report_overlap=True,how=None,preserve_order = True).df
+    if len(dfMatch2) == 0 or len(dfMatch3) == 0:
+        return pd.DataFrame({'id':[],'id_b':[]})
+    dfMatch2.loc[:,'matchID'] = dfMatch2[['id','id_b']].apply(lambda x: '___'.join(x),axis=1)
+    dfMatch3.loc[:,'matchID'] = dfMatch3[['id','id_b']].apply(lambda x: '___'.join(x),axis=1)
+    common = set(dfMatch2['matchID']).intersection(set(dfMatch3['matchID']))
+    return dfMatch2[dfMatch2['matchID'].isin(common)]
+# **
+
+def main():
+    rng = np.random.default_rng(args.seed)
+    centers = rng.integers(1000000,200000000,size = (len(chroms),args.hotspots))
+    df1 = simulate(args.num,centers,rng)
+    df2 = simulate(args.num,centers,rng)
+    print('matching ' + str(args.num) + ' vs. ' + str(args.num) + ' interchrom pairs with slack ' + str(args.slack))
+
+    start = time.time()
+    matches1 = doubleJoin(df1,df2,args.slack)
+    print('double join:  ' + str(round(time.time() - start,2)) + 's ' + str(len(matches1)) + ' matches')
+
+    start = time.time()
+    matches2 = matchBreakends(df1,df2,args.slack)
+    print('bucket index: ' + str(round(time.time() - start,2)) + 's ' + str(len(matches2)) + ' matches')
+
+    same = set(zip(matches1['id'],matches1['id_b'])) == set(zip(matches2['id'],matches2['id_b']))
+    print('same matches: ' + str(same))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# on-disk cache of parsed caller tables - reruns with new matching parameters skip vcf parsing
+# entries are keyed by the vcf path, size, modification time and leading bytes along with the parse options and the parser version
+# tables are stored as parquet when pyarrow is installed and as pickle otherwise
+
+import pandas as pd
+import os,json,hashlib,shutil
+
+# bump when parser output changes so stale entries are never loaded
+parser_version = 1
+
+# leading raw bytes of a vcf hashed into its key - covers the header of plain vcfs and the first blocks of compressed ones
+head_bytes = 1 << 16
+
+# *** identity of a vcf from its file stats and leading bytes - the vcf is never read in full ***
+def file_stamp(my_vcf):
+    stat = os.stat(my_vcf)
+    with open(my_vcf,'rb') as in1:
+        head = hashlib.sha1(in1.read(head_bytes)).hexdigest()
+    return [os.path.realpath(my_vcf),stat.st_size,stat.st_mtime_ns,head]
+# ***
+
+# *** cache key for one vcf and the options that change its parsed tables ***
+def cache_key(my_vcf,sample,numSVs,multi_svaba,regions):
+    options = [file_stamp(my_vcf),sample,numSVs,multi_svaba,sorted(regions.items()) if regions != None else None,parser_version]
+    return hashlib.sha1(json.dumps(options).encode()).hexdigest()
+# ***
+
+# ** storage format - parquet is used when available **
+def table_format():
+    try:
+        import pyarrow
+        return 'parquet'
+    except ImportError:
+        return 'pkl'
+# **
+
+# *** load cached caller and tables for a key - returns None when missing ***
+# runs sharing a cache can evict an entry while it is read - an entry that goes missing is a cache miss
+def load_entry(cache_dir,key):
+    entry_dir = cache_dir + key + '/'
+    try:
+        # mark entry as recently used before reading so eviction by other runs passes it over
+        os.utime(entry_dir + 'entry.json')
+        with open(entry_dir + 'entry.json') as in1:
+            entry = json.load(in1)
+
+        tables = dict()
+        for label in entry['labels']:
+            table_file = entry_dir + label + '.' + entry['format']
+            if entry['format'] == 'parquet':
+                tables[label] = pd.read_parquet(table_file)
+            else:
+                tables[label] = pd.read_pickle(table_file)
+    except FileNotFoundError:
+        return None
+    return entry['caller'],tables,entry['append']
+# ***
+
+# *** store caller and tables for a key - the size cap is enforced by evict once loads and stores are done ***
+def store_entry(cache_dir,key,caller,tables,append):
+    entry_dir = cache_dir + key + '/'
+    tmp_dir = cache_dir + key + '.tmp' + str(os.getpid()) + '/'
+    os.makedirs(tmp_dir,exist_ok = True)
+
+    fmt = table_format()
+    for label,df in tables.items():
+        if fmt == 'parquet':
+            df.to_parquet(tmp_dir + label + '.parquet',index = False)
+        else:
+            df.to_pickle(tmp_dir + label + '.pkl')
+    with open(tmp_dir + 'entry.json','w') as out1:
+        json.dump({'caller':caller,'labels':list(tables.keys()),'append':append,'format':fmt},out1)
+
+    # entries appear complete or not at all - the entry of another run storing the same key is kept
+    try:
+        os.rename(tmp_dir,entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir)
+# ***
+
+# *** remove least recently used entries until the cache fits in max_bytes ***
+# entries still being written by other runs are skipped and entries removed by them while sizing are left out
+def evict(cache_dir,max_bytes):
+    entries = []
+    for key in os.listdir(cache_dir):
+        if '.tmp' in key:
+            continue
+        entry_file = cache_dir + key + '/entry.json'
+        try:
+            size = sum([os.path.getsize(cache_dir + key + '/' + file) for file in os.listdir(cache_dir + key)])
+            entries.append((os.path.getmtime(entry_file),key,size))
+        except FileNotFoundError:
+            continue
+
+    total = sum([size for used,key,size in entries])
+    for used,key,size in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(cache_dir + key,ignore_errors = True)
+        total -= size
+# ***
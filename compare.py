@@ -1,154 +1,153 @@
 #!/usr/bin/env python3
 # compare normalized calls between callers and identify calls that overlap
-# note: pyranges is 0's based coords
 
 import pandas as pd
+import numpy as np
 from pandas.api.types import CategoricalDtype
-import pyranges as pr
 from utils import *
 
+# columns written to the matches1 table - codes and numeric match keys are kept in memory only
+matchColumns = ['sample','caller','id','chrom1','pos1','chrom2','pos2','caller_b','id_b','chrom1_b','pos1_b','chrom2_b','pos2_b','diff1','diff2','ro','matchID']
+
+# columns of matches returned by getMatches
+pairMatchColumns = ['code','chrom1','pos1','chrom2','pos2','code_b','chrom1_b','pos1_b','chrom2_b','pos2_b','diff1','diff2','ro']
+
+# ** empty match table for when no shards or caller pairs are matched - id codes stay integers so they index the id dictionary **
+def emptyMatches():
+    return(pd.DataFrame(columns = pairMatchColumns).astype({column:np.int64 for column in ['code','pos1','pos2','code_b','pos1_b','pos2_b','diff1','diff2']}))
+# **
+
+# ** intrachrom matches on one chromosome using reciprical overlap and slack **
+# candidates are pairs with both break points within slack so long svs do not overlap every call on the chromosome
+def intraMatches(df1a,df2a,slack,recipOverlap):
+    dfMatch1 = matchSpans(df1a,df2a,slack)
+
+    # apply matching criteria here to id overlaps
+    dfMatch1a = dfMatch1[(dfMatch1['code'] != dfMatch1['code_b']) & (dfMatch1['ro'] >= recipOverlap)]
+    return(dfMatch1a[pairMatchColumns].copy())
+# **
+
+# ** interchrom matches on one chromosome pair using slack only - both partners are matched at once with a bucket index **
+def interMatches(df1b,df2b,slack):
+    dfMatch2b = matchBreakends(df1b,df2b,slack)
+
+    # polish format
+    dfMatch2b['ro'] = 'NA'
+    dfMatch2b['diff1'] = abs(dfMatch2b['pos1'] - dfMatch2b['pos1_b'])
+    dfMatch2b['diff2'] = abs(dfMatch2b['pos2'] - dfMatch2b['pos2_b'])
+    return(dfMatch2b[pairMatchColumns + ['order','order_b']].copy())
+# **
+
 # *** getMatches from sets of paired BEs and returns the following table ***
-# sample,caller1,event_id1,chrom1,pos1,chrom2,pos2,caller2,event_id2,chrom2,pos2,diff1,diff2,ro
-def getMatches(df1,df2,slack=200,recipOverlap=0.8,verbose=True):
+# calls in df1 and df2 come from different callers so each match is found once
+# chromosomes (intrachrom) and chromosome pairs (interchrom) are matched as separate shards - in worker processes when jobs > 1
+# code1,chrom1,pos1,chrom2,pos2,code2,chrom2,pos2,diff1,diff2,ro - sv ids are given by id code
+def getMatches(df1,df2,slack=200,recipOverlap=0.8,verbose=True,jobs=1):
 
     if verbose:
         print('matching...',end='',flush=True)
     
     # ** perform intrachrom matching using reciprical overlap and slack **
-    df1a = df1[df1['chrom1'] == df1['chrom2']].copy()
-    df1a['Start'] = df1a['pos1'].astype(int) - 1; df1a['End'] = df1a['pos2'].astype(int); df1a['Chromosome'] = df1a['chrom1']
-    df2a = df2[df2['chrom1'] == df2['chrom2']].copy()
-    df2a['Start'] = df2a['pos1'].astype(int) - 1; df2a['End'] = df2a['pos2'].astype(int); df2a['Chromosome'] = df2a['chrom1']
-
-    # convert to rangest and compare 
-    pr1a = pr.PyRanges(df1a)
-    pr2a = pr.PyRanges(df2a)
-    prMatch1 = pr1a.join(pr2a,report_overlap=True,how=None,preserve_order = True)  # look for any overlap
-
-    # infer reciprical overlap
-    # minimal ratio of overlap vs. length of compared segment - this is the max compared segment
-    dfMatch1 = prMatch1.df
-    dfMatch1['width1'] = dfMatch1['End'] - dfMatch1['Start']
-    dfMatch1['width2'] = dfMatch1['End_b'] - dfMatch1['Start_b']
-    dfMatch1['maxWidth'] = dfMatch1[['width1','width2']].max(axis=1)    
-    dfMatch1['ro'] = dfMatch1['Overlap']/dfMatch1['maxWidth']
-
-    # infer differences in breakpoints
-    dfMatch1['diff1'] = abs(dfMatch1['Start'] - dfMatch1['Start_b'])
-    dfMatch1['diff2'] = abs(dfMatch1['End'] - dfMatch1['End_b'])
-    dfMatch1['maxDiff'] = dfMatch1[['diff1','diff2']].max(axis=1) # get the maximum difference between start and end breakend comparisons
-    
-    # apply matching criteria here to id overlaps
-    dfMatch1a = dfMatch1[(dfMatch1['id'] != dfMatch1['id_b']) & (dfMatch1['ro'] >= recipOverlap) & (dfMatch1['maxDiff'] <= slack)]
-    dfMatch1b = dfMatch1a[['sample','caller','id','chrom1','pos1','chrom2','pos2','caller_b','id_b','chrom1_b','pos1_b','chrom2_b','pos2_b','diff1','diff2','ro']].copy()
+    df1a = df1[df1['chrom1'] == df1['chrom2']]
+    df2a = df2[df2['chrom1'] == df2['chrom2']]
+
+    # shards come back in the natural chromosome order a single join reports
+    results = runShards(intraMatches,shardPairs(df1a,df2a,['chrom1']),[slack,recipOverlap],jobs)
+    dfMatch1b = pd.concat(results,axis=0,ignore_index = True) if len(results) > 0 else emptyMatches()
     # **
     
     # ** perform interchrom matching using slack only **
-    # perform comparison for each partner separately
-    df1b = df1[df1['chrom1'] != df1['chrom2']].copy()
-    df1b['Start'] = df1b['pos1'].astype(int) - 1; df1b['End'] = df1b['pos1'].astype(int); df1b['Chromosome'] = df1b['chrom1']
-    df1c = df1b.copy()
-    df1c['Start'] = df1c['pos2'].astype(int) - 1; df1c['End'] = df1c['pos2'].astype(int); df1c['Chromosome'] = df1c['chrom2']
-
-    df2b = df2[df2['chrom1'] != df2['chrom2']].copy()
-    df2b['Start'] = df2b['pos1'].astype(int) - 1; df2b['End'] = df2b['pos1'].astype(int); df2b['Chromosome'] = df2b['chrom1']
-    df2c = df2b.copy()
-    df2c['Start'] = df2c['pos2'].astype(int) - 1; df2c['End'] = df2c['pos2'].astype(int); df2c['Chromosome'] = df2c['chrom2']
-
-    # convert to ranges
-    pr1b = pr.PyRanges(df1b)
-    pr1c = pr.PyRanges(df1c)
-    pr2b = pr.PyRanges(df2b)
-    pr2c = pr.PyRanges(df2c)
-    
-    # get overlapping (matching) ranges with slack requirement
-    prMatch2 = pr1b.join(pr2b,slack = slack,report_overlap=True,how=None,preserve_order = True)
-    prMatch3 = pr1c.join(pr2c,slack = slack,report_overlap=True,how=None,preserve_order = True)    
-    dfMatch2 = prMatch2.df
-    dfMatch3 = prMatch3.df    
-
-    # get matches in both 
-    dfMatch2a = dfMatch2[dfMatch2['id'] != dfMatch2['id_b']].copy()  # remove self matches
-    dfMatch3a = dfMatch3[dfMatch3['id'] != dfMatch3['id_b']].copy()  # remove self matches
-    dfMatch2a.loc[:,'matchID'] = dfMatch2a[['id','id_b']].apply(lambda x: '___'.join(sorted(x)),axis=1)
-    dfMatch3a.loc[:,'matchID'] = dfMatch3a[['id','id_b']].apply(lambda x: '___'.join(sorted(x)),axis=1)
-
-    # filter to common
-    matchIDs2 = set(dfMatch2a['matchID'])
-    matchIDs3 = set(dfMatch3a['matchID'])
-    common = matchIDs2.intersection(matchIDs3)
-    dfMatch2b = dfMatch2a[dfMatch2a['matchID'].isin(common)].copy()
-
-    # polish format
-    dfMatch2b['ro'] = 'NA'
-    dfMatch2b['diff1'] = abs(dfMatch2b['pos1'].astype(int) - dfMatch2b['pos1_b'].astype(int))
-    dfMatch2b['diff2'] = abs(dfMatch2b['pos2'].astype(int) - dfMatch2b['pos2_b'].astype(int))
-    dfMatch2c = dfMatch2b[['sample','caller','id','chrom1','pos1','chrom2','pos2','caller_b','id_b','chrom1_b','pos1_b','chrom2_b','pos2_b','diff1','diff2','ro']].copy()
+    # table order is restored across shards
+    df1b = df1[df1['chrom1'] != df1['chrom2']].assign(order = lambda df: np.arange(len(df)))
+    df2b = df2[df2['chrom1'] != df2['chrom2']].assign(order = lambda df: np.arange(len(df)))
+    results = runShards(interMatches,shardPairs(df1b,df2b,['chrom1','chrom2']),[slack],jobs)
+    if len(results) > 0:
+        dfMatch2c = pd.concat(results,axis=0,ignore_index = True).sort_values(by=['order','order_b'])[pairMatchColumns]
+    else:
+        dfMatch2c = emptyMatches()
+    # **
     
     dfMatch = pd.concat([dfMatch1b,dfMatch2c],axis=0,ignore_index = True)
     return(dfMatch)
 # ***
 
+# ** rank callers by caller order - callers not in caller order follow by name **
+def rankCallers(callers,caller_order):
+    return(sorted(callers,key = lambda caller: (caller_order.index(caller) if caller in caller_order else len(caller_order),caller)))
+# **
+
 # *** identify overlapping svs across callers ***
-def compare(df1,out_dir,sample,caller_order,slack=200,recipOverlap=0.8,verbose=True):
+# known holds matches of caller pairs from an earlier run keyed by (caller,caller_b) - those pairs are not joined again
+def compare(df1,ids,pairs,out_dir,sample,caller_order,slack=200,recipOverlap=0.8,verbose=True,jobs=1,known=None):
     callers = sorted(list(set(df1['caller'])))
     outFile1 = out_dir + sample + '-matches1.txt'    
+    known = dict() if known == None else known
 
+    # callers present are listed and matched in caller order - callers of caller order without calls are left out
+    ranked = rankCallers(callers,caller_order)
     if verbose:
-        if len(callers) == len(caller_order):
-            callers = caller_order
-        print('comparing ' + ' vs. '.join(callers) + ' ...', flush=True)            
+        print('comparing ' + ' vs. '.join(ranked) + ' ...', flush=True)            
+
+    # ** paired BEs that are not dups - DO NOT INCLUDE MANTA INSERTION EVENTS **
+    dupCodes = pd.Index(ids['id']).get_indexer(df1.loc[df1['isDup'] == 'Y','id'])
+    pairs1 = pairs[~pairs['code'].isin(dupCodes) & ~pairs['isIns']].drop(columns = 'isIns')
+    # **
+
+    callerRanks = ids['caller'].map({caller:rank for rank,caller in enumerate(ranked)}).astype(int).to_numpy()[pairs1['code'].to_numpy()]
 
-    # ** first look for matching variants for calls from one caller compared to calls from other callers**
-    allMatches = None
-    for caller in callers:
+    # ** match calls from each caller against calls from each caller ranked after it **
+    # each cross caller match is joined once from the side of the caller ranked first so no reciprical matches need removing
+    allMatches = []
+    for rank,caller in enumerate(ranked[:-1]):
 
         if verbose:
             print('.' + caller + '...',end='',flush = True)
 
-        # filter svs to be compared for each caller
-        idx_not_dups = df1['isDup'] == 'N'
-        idx_caller = df1['caller'] == caller
-        idx_not_caller = df1['caller'] != caller
-        idx_manta_ins = (~df1['variant_id'].str.contains('INS'))  # DO NOT INCLUDE MANTA INSERTION EVENTS
-        dfa1 = df1[idx_not_dups & idx_caller & idx_manta_ins].copy()        
-        dfb1 = df1[idx_not_dups & idx_not_caller & idx_manta_ins].copy()                
+        dfa2 = pairs1[callerRanks == rank]
+        for rank_b in range(rank + 1,len(ranked)):
+            if (caller,ranked[rank_b]) in known:
+                # stored matches are keyed by id strings and take the id codes of this run
+                dfMatch = known[(caller,ranked[rank_b])].copy()
+                dfMatch['code'] = pd.Index(ids['id']).get_indexer(dfMatch['id']).astype(np.int64)
+                dfMatch['code_b'] = pd.Index(ids['id']).get_indexer(dfMatch['id_b']).astype(np.int64)
+                allMatches.append(dfMatch[pairMatchColumns])
+                continue
 
-        # ** convert to paired BEs **
-        dfa2 = convertPaired(dfa1,verbose)
-        dfb2 = convertPaired(dfb1,False) # set verbose to false because we already see message
+            # ** match paired BEs between callers **
+            dfb2 = pairs1[callerRanks == rank_b]
+            allMatches.append(getMatches(dfa2,dfb2,slack,recipOverlap,verbose,jobs))
 
-        # ** match paired BEs between callers **
-        matches1 = getMatches(dfa2,dfb2,slack,recipOverlap,verbose)
-
-        # concat matches from other callers
-        allMatches = matches1 if not isinstance(allMatches,pd.DataFrame) else pd.concat([allMatches,matches1],axis=0,ignore_index = True)
-        
         if verbose:
             print('done')
 
-    # ** for scenario when no overlapping variant_ids have been found
-    if not isinstance(allMatches,pd.DataFrame):
-        lineOut = 'no matching variants identified!'
-        with open(outFile1,'w') as out1:
-            out1.write(lineOut + '\n')
-        dfMatches = pd.DataFrame({'event_id':[lineOut]})
-        if verbose:
-            print('NO MATCHES FOUND!...done')
-        return dfMatches
+    # ** for scenario when no overlapping variant_ids have been found (e.g. only 1 caller has calls in the regions)
+    # select and merge go on with an empty match table so the calls are still written as non-matching
+    noMatches = len(allMatches) == 0
+    if noMatches:
+        allMatches = [emptyMatches()]
     # **
 
-    # ** remove reciprical matches selecting by caller order ** 
-    allMatches.loc[:,'matchID'] = allMatches[['id','id_b']].apply(lambda x: '___'.join(sorted(x)),axis=1)
+    matches2 = pd.concat(allMatches,axis=0,ignore_index = True)
+    codes1,codes2 = matches2['code'].to_numpy(),matches2['code_b'].to_numpy()
+    matches2['matchKey'] = matchKeys(ids,codes1,codes2)
+
+    # ** id strings are only rebuilt for output **
     callCategory = CategoricalDtype(categories = caller_order,ordered = True)
-    allMatches['caller'] = allMatches['caller'].astype(callCategory)
-    allMatches = allMatches.sort_values(by='caller')
-    idxDups = allMatches['matchID'].duplicated(keep = 'last')
-    matches2 = allMatches[idxDups]
+    matches2.insert(0,'sample',ids['sample'].to_numpy()[codes1])
+    matches2.insert(1,'caller',pd.Series(ids['caller'].to_numpy()[codes1]).astype(callCategory))
+    matches2.insert(2,'id',ids['id'].to_numpy()[codes1])
+    matches2.insert(matches2.columns.get_loc('code_b'),'caller_b',ids['caller'].to_numpy()[codes2])
+    matches2.insert(matches2.columns.get_loc('code_b'),'id_b',ids['id'].to_numpy()[codes2])
+    matches2['matchID'] = matchIDs(ids,codes1,codes2)
+    # **
 
-    matches2.to_csv(outFile1,sep="\t",index = False)
+    if noMatches:
+        with open(outFile1,'w') as out1:
+            out1.write('no matching variants identified!\n')
+    else:
+        matches2.to_csv(outFile1,sep="\t",index = False,columns = matchColumns)
 
     if verbose:
-        print('done')
+        print('NO MATCHES FOUND!...done' if noMatches else 'done')
         
     return matches2
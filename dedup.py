@@ -2,123 +2,107 @@
 # next remove duplicates
 
 import pandas as pd
-import pyranges as pr
 import numpy as np
 from utils import *
 
-def dedup(df_all,out_dir,sample,slack=200,recipOverlap=0.8,verbose = True):
+# known holds dup ids of callers deduped in an earlier run keyed by caller - those callers are not searched again
+def dedup(df_all,ids,pairs,out_dir,sample,slack=200,recipOverlap=0.8,verbose = True,jobs = 1,known = None):
     if(verbose):
         print('deduping...',flush=True)
 
-    # intialize variables
-    df_all['id'] = df_all['sample'] + '__' + df_all['caller'] + '__' + df_all['event_id']  # uniq id to flag dups later
-    df_all['isDup'] = 'N'  
+    known = dict() if known == None else known
     
-    # generate a list of duplicated ids to mark down
+    # generate a list of duplicated id codes to mark down
+    idIndex = pd.Index(ids['id'])
     callers = sorted(df_all['caller'].unique())
-    for caller in callers:
+    dupCodes = [idIndex.get_indexer(known[caller]) for caller in callers if caller in known]
+
+    # ** search each caller for dups - callers are searched in their own worker processes when jobs > 1 **
+    # each caller only touches its own paired BEs so dups are the same as a serial search
+    # jobs left over beyond one per caller are split between callers to search their shards
+    toSearch = [caller for caller in callers if caller not in known]
+    pairCallers = ids['caller'].to_numpy()[pairs['code'].to_numpy()]
+    tasks = [(pairs[pairCallers == caller].drop(columns = 'isIns'),) for caller in toSearch]
+    if jobs > 1 and len(toSearch) > 1:
         if verbose:
-            print('.' + caller + '...', end='',flush=True)
-        
-        df1 = df_all[df_all['caller'] == caller].copy()
-
-        # get dups and label
-        dupIDs = identifyDups(df1,slack,recipOverlap,verbose)
-        df_all['isDup'] = np.where((df_all['isDup'] == 'Y') | (df_all['id'].isin(dupIDs)),'Y','N') # :|
+            print('searching ' + ','.join(toSearch) + ' for dups with ' + str(min(jobs,len(toSearch))) + ' jobs ...', end='',flush=True)
+        dupCodes.extend(runShards(identifyDups,tasks,[ids,slack,recipOverlap,False,max(1,jobs // len(toSearch))],jobs))
         if verbose:
             print('done')
+    else:
+        for caller,task in zip(toSearch,tasks):
+            if verbose:
+                print('.' + caller + '...', end='',flush=True)
+            dupCodes.append(identifyDups(*task,ids,slack,recipOverlap,verbose,jobs))
+            if verbose:
+                print('done')
+    # **
+
+    # label dups of all callers at once
+    isDup = np.zeros(len(ids),dtype = bool)
+    if len(dupCodes) > 0:
+        isDup[np.concatenate(dupCodes).astype(np.int64)] = True
+    df_all['isDup'] = np.where(isDup[idIndex.get_indexer(df_all['id'])],'Y','N')
 
     # write combined with dup annotation
     outFile = out_dir + sample + '-svs.txt'
-    df_all.to_csv(outFile,sep="\t",index = False)
+    df_all.to_csv(outFile,sep="\t",index = False,na_rep = 'NA')
     
     if(verbose):    
         print('deduping done')
     return(df_all)
 
-# returns indexes of records that should be marked as duplicates
-def identifyDups(df1,slack=200,recipOverlap=0.8, verbose = True):
-
-    df1 = df1.sort_values(by='variant_id')
-
-    df2 = convertPaired(df1,verbose)
+# ** intrachrom dup candidates on one chromosome using reciprical overlap and slack **
+def intraDups(df2a,df2a_b,slack,recipOverlap):
+    df2b = matchSpans(df2a,df2a_b,slack) # compare to self
+    return(df2b.loc[(df2b['code'] != df2b['code_b']) & (df2b['ro'] >= recipOverlap),['code','code_b']])
+# **
+
+# ** interchrom dup candidates on one chromosome pair - both breakpoints within slack **
+def interDups(df3a,df3a_b,slack):
+    df3d = matchBreakends(df3a,df3a_b,slack)
+    return(df3d.loc[df3d['code'] != df3d['code_b'],['code','code_b']])
+# **
+
+# ** codes of calls outranked by a dup candidate partner **
+# calls are ranked by the columns (higher first) and then by id code (lower first)
+# each call is attached to the partners that outrank it - calls left unattached are the keepers of their cluster
+# so chains of near duplicate calls collapse to their best calls without merging calls that do not match each other
+def outranked(df,candidates,columns,numIDs):
+    if len(candidates) == 0:
+        return(np.array([],dtype = np.int64))
+    order = np.lexsort([df['code'].to_numpy()] + [-df[column].to_numpy() for column in reversed(columns)])
+    rank = np.zeros(numIDs,dtype = np.int64)
+    rank[df['code'].to_numpy()[order]] = np.arange(len(order))
+    candidates = pd.concat(candidates,axis=0,ignore_index = True)
+    codes,codes_b = candidates['code'].to_numpy(),candidates['code_b'].to_numpy()
+    return(np.unique(codes[rank[codes_b] < rank[codes]]))
+# **
+
+# returns id codes of records that should be marked as duplicates
+# takes the paired break points of one caller - chromosomes (or chromosome pairs) are searched as separate shards
+def identifyDups(df2,ids,slack=200,recipOverlap=0.8, verbose = True,jobs = 1):
+
+    df2 = orderByChrom(df2)
     df2['dp'] = df2[['dp1','dp2']].min(axis=1)
-    df2['spanning'] = df2[['spanning1','spanning2']].min(axis=1)            
+    df2['spanning'] = df2[['spanning1','spanning2']].min(axis=1)
 
     if verbose:
         print('searching for dups...',end='',flush=True)
     
-    # ** for intrachrom events we can perform reciprical overlap **
-    df2a = df2[df2['chrom1'] == df2['chrom2']].copy()
-    df2a['Start'] = df2a['pos1'].astype(int) - 1; df2a['End'] = df2a['pos2'].astype(int); df2a['Chromosome'] = df2a['chrom1']
-
-    pr2a = pr.PyRanges(df2a)
-    overlap1 = pr2a.join(pr2a,report_overlap=True,how=None,preserve_order = True) # compare to self
+    # candidates only need break points so dense clusters of near duplicate calls do not copy whole rows
+    columns = ['code','chrom1','pos1','chrom2','pos2']
 
-    # infer reciprical overlap
-    # the minimal ratio of overlap vs. length of compared segment - this is the max compared segment    
-    df2b = overlap1.df
-    df2b['width1'] = df2b['End'] - df2b['Start']
-    df2b['width2'] = df2b['End_b'] - df2b['Start_b']
-    df2b['maxWidth'] = df2b[['width1','width2']].max(axis=1)    
-    df2b['ro'] = df2b['Overlap']/df2b['maxWidth']
-
-    # infer differences in breakpoints
-    df2b['diff1'] = abs(df2b['Start'] - df2b['Start_b'])
-    df2b['diff2'] = abs(df2b['End'] - df2b['End_b'])
-    df2b['maxDiff'] = df2b[['diff1','diff2']].max(axis=1)    
-    
-    # ** get intrachrom dups **
-    df2c = df2b[(df2b['id'] != df2b['id_b']) & (df2b['ro'] >= recipOverlap) & (df2b['maxDiff'] <= slack)].copy()
-    
-    # ** add matchid so that reciprical matches so that we can prioritize and select duplicates to mark **
-    if len(df2c) > 0:
-        df2c.loc[:,'matchID'] = df2c[['id','id_b']].apply(lambda x: '___'.join(sorted(x)),axis=1)
-        df2c = df2c.sort_values(by=['dp','id'],ascending=[False,True])    # order
-        idxDups = df2c['matchID'].duplicated(keep = 'first')
-        df2d = df2c[idxDups]
-        dupIDs1 = list(df2d['id'])  # these are intrachrom duplicates
-    else:
-        dupIDs1 = []
+    # ** for intrachrom events we can perform reciprical overlap - dups are outranked by read depth **
+    df2a = df2[df2['chrom1'] == df2['chrom2']]
+    results = runShards(intraDups,shardPairs(df2a[columns],None,['chrom1']),[slack,recipOverlap],jobs)
+    dupIDs1 = outranked(df2a,results,['dp'],len(ids))  # these are intrachrom duplicates
     # **
 
-    # ** for interchrom events we compare breakpoints separately using slack **
-    df3a = df2[df2['chrom1'] != df2['chrom2']].copy()
-    df3b = df3a.copy()
-    df3b['Start'] = df3b['pos1'].astype(int) - 1; df3b['End'] = df3b['pos1'].astype(int); df3b['Chromosome'] = df3b['chrom1']
-    df3c = df3a.copy()
-    df3c['Start'] = df3c['pos2'].astype(int) - 1; df3c['End'] = df3c['pos2'].astype(int); df3c['Chromosome'] = df3b['chrom2']
-
-    # get overlapping ranges
-    pr3b = pr.PyRanges(df3b)
-    pr3c = pr.PyRanges(df3c)
-    overlap1 = pr3b.join(pr3b,slack = slack,report_overlap=True,how=None,preserve_order = True)
-    overlap2 = pr3c.join(pr3c,slack = slack,report_overlap=True,how=None,preserve_order = True)    
-    df3d = overlap1.df
-    df3e = overlap2.df    
-
-    # ** add matchid so that reciprical matches so that we can prioritize and select duplicates to mark **
-    df3d1 = df3d[df3d['id'] != df3d['id_b']].copy()
-    df3e1 = df3e[df3e['id'] != df3e['id_b']].copy()
-
-    # ** make sure we have candidate dups **
-    if len(df3d1) > 0 and len(df3e1) > 0:
-        df3d1.loc[:,'matchID'] = df3d1[['id','id_b']].apply(lambda x: '___'.join(sorted(x)),axis=1)
-        df3e1.loc[:,'matchID'] = df3e1[['id','id_b']].apply(lambda x: '___'.join(sorted(x)),axis=1)
-
-        # get rid of reciprical matches
-        df3d1 = df3d1.sort_values(by=['spanning','dp','id'],ascending=[False,False,True])    # order
-        df3e1 = df3e1.sort_values(by=['spanning','dp','id'],ascending=[False,False,True])    # order    
-        idxDups3d1 = df3d1['matchID'].duplicated(keep = 'first')
-        idxDups3e1 = df3e1['matchID'].duplicated(keep = 'first')    
-        df3d2 = df3d1[idxDups3d1]
-        df3e2 = df3e1[idxDups3e1]        
-
-        # get list of dups and take intersection - look for start and ends that are close via slack
-        dups3d2 = list(df3d2['id'])
-        dups3e2 = list(df3e2['id'])
-        dupIDs2 = [id for id in dups3d2 if id in dups3e2]  # these are interchrom dups
-    else:
-        dupIDs2 = []
+    # ** for interchrom events we compare both breakpoints at once using slack - dups are outranked by spanning reads then depth **
+    df3a = df2[df2['chrom1'] != df2['chrom2']]
+    results = runShards(interDups,shardPairs(df3a[columns],None,['chrom1','chrom2']),[slack],jobs)
+    dupIDs2 = outranked(df3a,results,['spanning','dp'],len(ids))  # start and ends are both close via slack
+    # **
 
-    return(sorted(dupIDs1 + dupIDs2))
+    return(np.union1d(dupIDs1,dupIDs2))
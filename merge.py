@@ -1,73 +1,105 @@
 #!/usr/bin/env python
 # create final table with calls merged such that variants are unique
 
+import pandas as pd
 import numpy as np
+import time
+from writer import sort_open,sort_chunk,sort_write
 
-# ** create vcf formatted line out **
-def get_vcf_line_out(header2,record):
+# number of lines formatted and written at a time - also the lines held in memory per sorted run of an indexed vcf
+chunkSize = 100000
+
+# GRCh38 standard contigs in the order sorted vcfs are written
+contigs = [('chr1',248956422),('chr2',242193529),('chr3',198295559),('chr4',190214555),('chr5',181538259),('chr6',170805979),
+           ('chr7',159345973),('chr8',145138636),('chr9',138394717),('chr10',133797422),('chr11',135086622),('chr12',133275309),
+           ('chr13',114364328),('chr14',107043718),('chr15',101991189),('chr16',90338345),('chr17',83257441),('chr18',80373285),
+           ('chr19',58617616),('chr20',64444167),('chr21',46709983),('chr22',50818468),('chrX',156040895),('chrY',57227415),('chrM',16569)]
+
+# ** join string columns into tab-delimited lines **
+def join_columns(columns):
+    lines = columns[0]
+    for column in columns[1:]:
+        lines = lines + '\t' + column
+    return lines + '\n'
+# **
+
+# ** create vcf formatted lines out - one string column per vcf field **
+def get_vcf_lines(header2,df):
     lookup = {'#CHROM':'chrom','POS':'pos','REF':'ref','ALT':'alt','ID':'variant_id','QUAL':'100','FILTER':'PASS'}
-    lineOut = []    
+    columns = []
     for field in header2:
-        if field in lookup and lookup[field] in record:
-            lineOut.append(str(record[lookup[field]]))
+        if field in lookup and lookup[field] in df.columns:
+            columns.append(df[lookup[field]].to_numpy())
         elif field in lookup:
-            lineOut.append(str(lookup[field]))
+            columns.append(np.full(len(df),lookup[field],dtype = object))
         elif field == 'INFO':
-            span = "SPAN="+str(record['intra_chrom_event_length'])
-            mate_id="MATEID="+str(record['mate_id'])
-            id_="ID="+record['variant_id']
-            event="event="+record['event_id']
-            info = ';'.join([span,mate_id,id_,event])
-            lineOut.append(info)
+            columns.append('SPAN=' + df['intra_chrom_event_length'].to_numpy() + ';MATEID=' + df['mate_id'].to_numpy() + ';ID=' + df['variant_id'].to_numpy() + ';event=' + df['event_id'].to_numpy())
         elif field == 'FORMAT':
             format_ = ':'.join(["GT","AD","DP","DR","SR"])
-            lineOut.append(format_)
+            columns.append(np.full(len(df),format_,dtype = object))
         elif field == 'tumor_sample':
-            disc = record['tumor_discordant_rs']
-            span = record['tumor_spanning_rs']
-            ad = disc if int(disc) > int(span) else span
-            tumor_sample = ':'.join(['0/1',str(ad),str(record['tumor_dp']),str(disc),str(span)])
-            assert format_.count(':') == tumor_sample.count(':')
-            lineOut.append(tumor_sample)
+            disc = df['tumor_discordant_rs'].to_numpy()
+            span = df['tumor_spanning_rs'].to_numpy()
+            ad = np.where(df['disc_rs'].to_numpy() > df['span_rs'].to_numpy(),disc,span)
+            columns.append('0/1:' + ad + ':' + df['tumor_dp'].to_numpy() + ':' + disc + ':' + span)
         else:
             print('i no understand')
             print(field)
             raise
 
-    return lineOut
+    return join_columns(columns)
 # **
 
 # ** combine together matching calls and write to a sensible tab-delimited file and a non-sensible vcf file **
-def merge(df_all,df_comp,out_dir,sample,verbose,caller_order = ['svaba','manta','gridss']):
+# with vcf_index tbi or csi the vcf is written coordinate sorted, bgzipped and indexed with ##contig headers
+def merge(df_all,ids,df_comp,out_dir,sample,verbose,caller_order = ['svaba','manta','gridss'],vcf_index = 'F'):
     outFile1 = out_dir + sample + '-sv-merge.txt'
-    outFile2 = out_dir + sample + '-sv-merge.vcf'    
+    outFile2 = out_dir + sample + '-sv-merge.vcf' + ('' if vcf_index == 'F' else '.gz')
     if verbose:
         outFiles = ','.join([outFile1,outFile2])
-        print('merging and writing to ' + outFiles + ' ...',end='')    
+        print('merging and writing to ' + outFiles + ' ...',end='')
 
     # filter to select SVs and matches
-    df_all1 = df_all[df_all['isDup'] == 'N'].copy()    
-    df_comp1 = df_comp[df_comp['isSelect'] == 'Y'].copy()
+    df_all1 = df_all[df_all['isDup'] == 'N']
+    df_comp1 = df_comp[df_comp['isSelect'] == 'Y']
+
+    # caller of each sv id from the id dictionary
+    id2caller = dict(zip(ids['id'],ids['caller']))
 
     # ** create a match lookup table **
-    # ** ids in this table are representative
-    # ** other ids can be sourced for each  clique
-    id2clique = dict()
-    clique2other = dict()    
-    for idx,row in df_comp1.iterrows():
-        rowDict = row.to_dict()
-        id1,id2,cliqueID,other = rowDict['id'],rowDict['id_b'],rowDict['cliqueID'],rowDict['other_variant_ids']
-        id2clique[id1] = cliqueID
-        id2clique[id2] = cliqueID
-
-        # include superset of matched others
-        others = other.split(',')
-        if cliqueID in clique2other:
-            clique2other[cliqueID] = ','.join(list(sorted(set(clique2other[cliqueID].split(',') + others))))
-        else:
-            clique2other[cliqueID] = ','.join(others)
+    # ** ids in this table are representative - a later select match overrides the clique of an id
+    # ** other ids can be sourced for each  clique as the superset of matched others
+    members = pd.DataFrame({'id':np.column_stack([df_comp1['id'].to_numpy(),df_comp1['id_b'].to_numpy()]).ravel(),'cliqueID':np.repeat(df_comp1['cliqueID'].to_numpy(),2)})
+    id2clique = members.drop_duplicates('id',keep = 'last').set_index('id')['cliqueID']
+    clique2other = dict()
+    for cliqueID,other in zip(df_comp1['cliqueID'].tolist(),df_comp1['other_variant_ids'].tolist()):
+        clique2other.setdefault(cliqueID,set()).update(other.split(','))
+    # **
+
+    # ** fill in merged values - only svs outside of a clique and clique representatives are written **
+    # svs are matching when they are an end of a select match - a cliqueID without a select match of its own is not
+    cliques = df_all1['id'].map(id2clique)
+    keep = cliques.isna() | (cliques == df_all1['id'])
+    dfOut = df_all1[keep].copy()
+    isMatching = cliques[keep].notna().to_numpy()
 
-    with open(outFile1,'w') as out1, open(outFile2,'w') as out2:
+    dfOut['call_source'] = dfOut['caller'].astype(str)
+    dfOut['is_matching'] = np.where(isMatching,'Y','N')
+    dfOut['callers'] = dfOut['call_source']
+    dfOut['num_callers'] = 1
+    dfOut['other_variant_ids'] = 'NA'
+    if isMatching.any():
+        matched = dfOut.loc[isMatching,['id','sample','call_source']]
+        others = [clique2other[id] for id in matched['id'].tolist()]
+        callers = [sorted(set([id2caller[id] for id in other]) | {caller}) for other,caller in zip(others,matched['call_source'].tolist())]
+        # fix legacy id to match
+        dfOut.loc[isMatching,'other_variant_ids'] = [','.join(sorted(other)).replace(label + '__','') for other,label in zip(others,matched['sample'].astype(str).tolist())]
+        dfOut.loc[isMatching,'num_callers'] = [len(callers1) for callers1 in callers]
+        dfOut.loc[isMatching,'callers'] = [';'.join(callers1) for callers1 in callers]
+    dfOut['intra_chrom_event_length'] = dfOut['intra_chrom_event_length'].astype(object).where(dfOut['intra_chrom_event_length'].notna(),'NA')
+    # **
+
+    with open(outFile1,'w') as out1:
         # assemble and write header
         header1 = ['sample','event_id','is_matching','variant_id','chrom','pos','ref','alt','mate_id','callers','num_callers','call_source','tumor_discordant_rs','tumor_spanning_rs','tumor_dp','intra_chrom_event_length','other_variant_ids']
         out1.write('\t'.join(header1) + '\n')
@@ -78,7 +110,7 @@ def merge(df_all,df_comp,out_dir,sample,verbose,caller_order = ['svaba','manta',
                        '##reference=/fh/fast/ha_g/grp/reference/GRCh38/Broad_bundle_hg38/v0/Homo_sapiens_assembly38.fasta',
                        '##INFO=<ID=MATEID,Number=1,Type=String,Description="ID of mate breakends">',
                        '##INFO=<ID=ID,Number=1,Type=String,Description="variant_id">',
-                       '##INFO=<ID=event,Number=1,Type=String,Description="event_id">',                                              
+                       '##INFO=<ID=event,Number=1,Type=String,Description="event_id">',
                        '##INFO=<ID=SPAN,Number=1,Type=Integer,Description="Distance between the breakpoints. -1 for interchromosomal">',
                        '##FORMAT=<ID=AD,Number=1,Type=Integer,Description="Allele depth: Number of reads supporting the variant">',
                        '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth of coverage: Number of reads covering site.">',
@@ -86,59 +118,36 @@ def merge(df_all,df_comp,out_dir,sample,verbose,caller_order = ['svaba','manta',
                        '##FORMAT=<ID=DR,Number=1,Type=Integer,Description="Number of discordant-supported reads for this variant">',
                        '##FORMAT=<ID=SR,Number=1,Type=Integer,Description="Number of spanning reads for this variants">',
                        "##SAMPLE=<ID=tumor_sample>"]
-        for row in header_rows:
-            out2.write(row + '\n')                
+        # indexed vcfs carry the run date and the contigs they are sorted by
+        if vcf_index != 'F':
+            header_rows[1] = '##filedate=' + time.strftime('%Y%m%d')
+            header_rows[3:3] = ['##contig=<ID=' + chrom + ',length=' + str(length) + '>' for chrom,length in contigs]
         header2 = ['#CHROM','POS','ID','REF','ALT','QUAL','FILTER','INFO','FORMAT','tumor_sample']
-        out2.write('\t'.join(header2) + '\n')        
-
-        # walk through each record and decide to write or not write
-        for idx,row in df_all1.iterrows():
-            record = row.to_dict()
-            id = record['id']
-
-            # ** fill in missing values **
-            record['call_source'] = id.split('__')[1]
-            # match
-            if id in id2clique:
-                record['other_variant_ids'] = clique2other[id2clique[id]]
-
-                # fix legacy id to match
-                label = record['sample'] + '__'
-                record['other_variant_ids'] = record['other_variant_ids'].replace(label,'')
-                
-                ids1 = record['other_variant_ids'].split(',')
-                callers = sorted(list(set([id.split('__')[0] for id in ids1] + [record['call_source']])))
-                
-                record['is_matching'] = 'Y'                
-                record['num_callers'] = len(callers)
-                record['callers'] = ';'.join(callers)
-            # no match
+        header = ''.join([row + '\n' for row in header_rows]) + '\t'.join(header2) + '\n'
+
+        # plain vcf lines are written in table order while lines of an indexed vcf are spilled as sorted runs
+        if vcf_index == 'F':
+            out2 = open(outFile2,'w')
+            out2.write(header)
+        else:
+            sorter = sort_open(out_dir,[chrom for chrom,length in contigs])
+
+        # ** format whole columns a chunk at a time and write each file in one call per chunk **
+        for start in range(0,len(dfOut),chunkSize):
+            dfChunk = dfOut.iloc[start:start + chunkSize]
+            dfText = pd.DataFrame({field:dfChunk[field].astype(str).to_numpy(dtype = object) for field in header1},index = dfChunk.index)
+            out1.write(''.join(join_columns([dfText[field].to_numpy() for field in header1])))
+
+            # read counts are compared as numbers to pick the allele depth
+            dfText['disc_rs'],dfText['span_rs'] = dfChunk['tumor_discordant_rs'].astype(int).to_numpy(),dfChunk['tumor_spanning_rs'].astype(int).to_numpy()
+            if vcf_index == 'F':
+                out2.write(''.join(get_vcf_lines(header2,dfText)))
             else:
-                record['is_matching'] = 'N'
-                record['other_variant_ids'] = record['num_callers'] = record['callers'] = 'NA'
-                record['callers'] = record['call_source']
-                record['num_callers'] = 1 
-            # **
-
-            if not isinstance(record['intra_chrom_event_length'],str) and not np.isnan(record['intra_chrom_event_length']):
-                record['intra_chrom_event_length'] = str(int(record['intra_chrom_event_length']))
-            """
-            # ** testing code **
-            if record['event_id'] == '1001442:1':
-                print(record)
-                raise
-            """
-            
-            # if in clique but not the cliqueID then ski;
-            if id in id2clique and id != id2clique[id]:
-                continue
-            elif id not in id2clique or (id in id2clique and id == id2clique[id]):
-                # ** gather and write lineOut for txt file **
-                lineOut = []
-                for field in header1:
-                    lineOut.append(str(record[field]))
-                out1.write('\t'.join(lineOut) + '\n')
-
-                # write vcf line out
-                lineOut = get_vcf_line_out(header2,record)
-                out2.write('\t'.join(lineOut) + '\n')                
+                sort_chunk(sorter,get_vcf_lines(header2,dfText),dfText['chrom'].to_numpy(),dfChunk['pos'].to_numpy())
+        # **
+
+    # merge sorted runs to the bgzipped vcf and its index
+    if vcf_index == 'F':
+        out2.close()
+    else:
+        sort_write(sorter,outFile2,header,vcf_index)
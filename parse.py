@@ -2,193 +2,325 @@
 # parse vcf files
 
 import pandas as pd
-import vcf,os,re
+import os,re,itertools
+from utils import write_table
+from concurrent.futures import ProcessPoolExecutor
+from reader import *
+from cache import cache_key,load_entry,store_entry,evict
 
 
 chroms = ['chr1','chr2','chr3','chr4','chr5','chr6','chr7','chr8','chr9','chr10','chr11','chr12','chr13','chr14','chr15','chr16','chr17','chr18','chr19','chr20','chr21','chr22','chrX', 'chrY','chrM']
 
-# *** determine caller, parse, generate a data frame ***
-def parse_vcfs(vcf_list,out_dir,sample,numSVs,verbose):
-#    """
-    filenames = []
+standard_chroms = set(chroms)
 
-    # check if more than one svaba file - impacts combining calls when parsing
-    multi_svaba = True if len([file for file in vcf_list if 'svaba' in file]) > 1 else False
-
-    for my_vcf in vcf_list:
-        # determine caller
-        with open(my_vcf) as in1:
-            caller = 'NA'
-            for line in in1:
-                if 'manta' in line or 'Manta' in line:
-                    caller = 'manta'
-                    break
-                elif 'svaba' in line:
-                    caller = 'svaba'
-                    break
-                elif 'gridss' in line:
-                    caller = 'gridss'
-                    break
+# ** compact typed schema for the combined sv table - applied once when calls are parsed and kept by later stages **
+# chrom categories follow the chroms order above, read counts without a value become 0 and event lengths are nullable
+sv_schema = {'sample':'category','caller':'category','variant_type':'category','chrom':pd.CategoricalDtype(chroms),'pos':'int32',
+             'tumor_discordant_rs':'int32','tumor_spanning_rs':'int32','tumor_dp':'int32','intra_chrom_event_length':'Int32'}
 
-        # call parse function
-        if caller == 'manta':
-            filename1 = parse_manta(my_vcf,out_dir,sample,verbose,numSVs)
-            filename = modify_manta(filename1,out_dir,sample,verbose) # generated updated manta call have 2 break points per manta del,ins,dup event
-        elif caller == 'svaba':
-            filename = parse_svaba(my_vcf,out_dir,sample,verbose,multi_svaba,numSVs)
-        elif caller == 'gridss':
-            filename = parse_gridss(my_vcf,out_dir,sample,verbose,numSVs)            
+def apply_schema(df):
+    df = df.copy()
+    for column,dtype in sv_schema.items():
+        if dtype == 'int32':
+            df[column] = pd.to_numeric(df[column],errors = 'coerce').fillna(0).astype(dtype)
+        elif dtype == 'Int32':
+            df[column] = pd.to_numeric(df[column],errors = 'coerce').astype(dtype)
         else:
-            print('Caller not recognized!!')
-            raise
-        filenames.append(filename)
+            df[column] = df[column].astype(dtype)
+    return df
+# **
+
+# number of leading records buffered to infer the tumor genotype column
+num_tumor_calls = 30
+
+# genotype FORMAT keys read by each caller parser - all other keys are never decoded
+caller_keys = {'manta':('SR','PR'),'svaba':('AD','DR','SR','DP'),'gridss':('SR','VF','REF')}
+
+# ** returns the stage a record is rejected at using raw CHROM and ALT text or None if it is kept **
+def reject_contig(chrom,alt):
+    alt = alt.split(',')[0]
+    if chrom not in standard_chroms:
+        return 'chrom'
+    elif 'chrUn' in alt or 'alt' in alt or 'random' in alt or 'HLA-' in alt:
+        return 'alt'
+    return None
+# **
+
+# ** summary of records skipped at each stage for screen output **
+def report_skipped(skipped):
+    return ' (skipped ' + ', '.join([str(skipped[stage]) + ' by ' + stage for stage in skipped]) + ')'
+# **
+
+# ** determine caller from vcf header lines only **
+def detect_caller(vcf_header):
+    for line in vcf_header['lines']:
+        if 'manta' in line or 'Manta' in line:
+            return 'manta'
+        elif 'svaba' in line:
+            return 'svaba'
+        elif 'gridss' in line:
+            return 'gridss'
+    return 'NA'
+# **
 
-    filenames = sorted(list(set(filenames)))
-#    """
-#    filenames = ['intermediate/02/results/LNCaP_FGC-gridss.txt', 'intermediate/02/results/LNCaP_FGC-manta_modified.txt', 'intermediate/02/results/LNCaP_FGC-svaba.txt']
-#    print(filenames)
-    
-    # generate combined table 
-    flag = None
-    for filename in filenames:
-        df = pd.read_csv(filename,sep="\t",na_values = 'NA',na_filter = False, dtype = 'unicode')
-        if flag == None:
-            df_all = df.copy()
-            flag = True
-        else:
-            df_all = pd.concat([df_all,df],axis=0)
+# *** determine caller, parse, generate a data frame ***
+# caller tables are handed over in memory - the per caller .txt files are written in the background when requested
+# with a cache directory, tables parsed by an earlier run with the same vcfs and options are loaded instead of reparsed
+# keys are the cache keys of the vcfs when the caller already has them so they are not computed twice
+def parse_vcfs(vcf_list,out_dir,sample,numSVs,verbose,check_parity_=False,jobs=1,write_tables=True,regions=None,cache_dir=None,cache_bytes=0,multi_svaba=None,keys=None):
+    # check if more than one svaba file - impacts combining calls when parsing
+    # given when only part of a sample's vcfs are parsed
+    if multi_svaba == None:
+        multi_svaba = is_multi_svaba(vcf_list)
+
+    # ** load previously parsed tables from the cache - only vcfs without an entry are parsed **
+    results = [None] * len(vcf_list)
+    if cache_dir != None:
+        os.makedirs(cache_dir,exist_ok = True)
+        if keys == None:
+            keys = [cache_key(my_vcf,sample,numSVs,multi_svaba,regions) for my_vcf in vcf_list]
+        for idx,my_vcf in enumerate(vcf_list):
+            results[idx] = load_entry(cache_dir,keys[idx])
+            if verbose and results[idx] != None:
+                print('loaded cached tables for ' + my_vcf)
+    to_parse = [idx for idx in range(len(vcf_list)) if results[idx] == None]
+    # **
+
+    if jobs > 1 and len(to_parse) > 1:
+        # ** parse each vcf in its own worker process **
+        # screen output from workers would interleave so progress is reported here
+        if verbose:
+            print('parsing ' + ','.join([vcf_list[idx] for idx in to_parse]) + ' with ' + str(min(jobs,len(to_parse))) + ' jobs ...',end='',flush=True)
+        with ProcessPoolExecutor(max_workers = min(jobs,len(to_parse))) as executor:
+            futures = {idx:executor.submit(parse_vcf,vcf_list[idx],sample,numSVs,False,multi_svaba,check_parity_,regions) for idx in to_parse}
+            for idx in to_parse:
+                results[idx] = futures[idx].result()
+        if verbose:
+            print('done')
+        # **
+    else:
+        for idx in to_parse:
+            results[idx] = parse_vcf(vcf_list[idx],sample,numSVs,verbose,multi_svaba,check_parity_,regions)
+
+    # entries used by this run are the most recent so least recently used entries go first when over the size cap
+    if cache_dir != None:
+        for idx in to_parse:
+            store_entry(cache_dir,keys[idx],*results[idx])
+        evict(cache_dir,cache_bytes)
+
+    # ** collect tables in vcf order - svaba sv calls are appended to svaba indel calls when there are several svaba vcfs **
+    tables = dict()
+    for caller,caller_tables,append in results:
+        for label,df in caller_tables.items():
+            if append and label in tables:
+                tables[label].append(df)
+            else:
+                tables[label] = [df]
+    tables = {label:pd.concat(dfs,axis=0,ignore_index = True) for label,dfs in tables.items()}
+
+    if write_tables:
+        for label in sorted(tables.keys()):
+            write_table(tables[label],out_dir + sample + '-' + label + '.txt')
+    # **
+
+    # generate combined table - raw manta calls are replaced by the modified manta calls
+    labels = sorted([label for label in tables.keys() if label != 'manta'])
+    df_all = pd.concat([tables[label] for label in labels],axis=0,ignore_index = True)
+    df_all = apply_schema(df_all)
+    df_all['id'] = df_all['sample'].astype(str) + '__' + df_all['caller'].astype(str) + '__' + df_all['event_id']  # uniq id to flag dups later
 
     # return combined table of svs
-    df_all = df_all.reset_index(drop = True)
     return df_all
 # ***
 
-# *** modify manta calls to be comparable with other sv callers ***
-def modify_manta(inFile,out_dir,sample,verbose):
-    df = pd.read_csv(inFile,sep="\t",na_values = 'NA',na_filter = False, dtype = 'unicode')
+# ** more than one svaba vcf - svaba sv calls are then appended to svaba indel calls **
+def is_multi_svaba(vcf_list):
+    return True if len([file for file in vcf_list if 'svaba' in file]) > 1 else False
+# **
+
+# *** determine caller and parse a single vcf ***
+# returns caller, parsed tables by output label and whether tables are appended to earlier tables with the same label
+# regions restrict parsing to records in the regions plus breakends whose mates are in the regions
+def parse_vcf(my_vcf,sample,numSVs,verbose,multi_svaba,check_parity_=False,regions=None):
+    # each vcf is opened and read once - caller from header, tumor column from buffered leading records, then parsing
+    with open_vcf(my_vcf) as in1:
+        vcf_header = read_header(in1)
+        caller = detect_caller(vcf_header)
+        if caller == 'NA':
+            print('Caller not recognized!!')
+            raise Exception('no manta, svaba or gridss header lines found in ' + my_vcf)
+
+        # optionally confirm fast reader matches PyVCF before trusting parsed tables
+        if check_parity_ and check_parity(my_vcf,caller_keys[caller],verbose) != 0:
+            raise Exception('fast vcf reader does not match PyVCF for ' + my_vcf)
+
+        # determine which genotype field to read from as tumor
+        assert len(vcf_header['samples']) in [1,2]
+        records = iter_records(in1) if regions == None else region_records(my_vcf,in1,regions)
+        if len(vcf_header['samples']) == 1:
+            tumor_idx = 0
+        else:
+            # since tumor may not always be last, confirm that it is and throw an warning if it's not
+            # buffered records are replayed ahead of the rest of the file for parsing
+            buffered = list(itertools.islice(records,num_tumor_calls))
+            tumor_idx = infer_tumor_idx(vcf_header,buffered,caller)
+            records = itertools.chain(buffered,records)
 
+        # call parse function
+        append = False
+        if caller == 'manta':
+            df1 = parse_manta(my_vcf,vcf_header,records,tumor_idx,sample,verbose,numSVs)
+            df2 = modify_manta(df1,verbose) # generated updated manta call have 2 break points per manta del,ins,dup event
+            tables = {'manta':df1,'manta_modified':df2}
+        elif caller == 'svaba':
+            # indel and sv vcfs for svaba so sv calls are added to indel calls
+            append = multi_svaba and 'sv.vcf' in my_vcf
+            tables = {'svaba':parse_svaba(my_vcf,vcf_header,records,tumor_idx,sample,verbose,numSVs)}
+        elif caller == 'gridss':
+            tables = {'gridss':parse_gridss(my_vcf,vcf_header,records,tumor_idx,sample,verbose,numSVs)}
+    return caller,tables,append
+# ***
+
+# *** modify manta calls to be comparable with other sv callers ***
+def modify_manta(df,verbose):
     # ** manta variant_id labeing patch **
-    # updated to group by events and then iterate through events looking for out of order variant_id labels (manta issue)
-    df = df.sort_values(by='variant_id')
-    grouped_df = df.groupby('event_id')
-    for event,group in grouped_df:
-        assert len(group) <= 2
-
-        # only care about events with 2 variants
-        if len(group) == 2:
-            
-            # Extract values for comparison
-            chrom1,chrom2 = group['chrom']
-            pos1,pos2 = group['pos']
-            variant1,variant2 = group['variant_id']
-
-            # look for intra chom events that are out of order
-            if chrom1 == chrom2 and int(pos1) > int(pos2):
-                df.loc[group.index, 'variant_id'] = [variant2, variant1]
-                df.loc[group.index, 'mate_id'] = [variant1, variant2]
-    df = df.sort_values(by='variant_id')
-#    print('done')
+    # events are paired up by position after sorting by variant_id and out of order variant_id labels are swapped for all events at once (manta issue)
+    # nothing to pair up or expand when every call was filtered out or fell outside the regions
+    if len(df) == 0:
+        return df
+    df = df.sort_values(by='variant_id').reset_index(drop = True)
+    grouped_df = df.groupby('event_id',sort = False)
+    size = grouped_df['variant_id'].transform('size')
+    assert (size <= 2).all()
+
+    # only care about events with 2 variants - the first variant of each pair is compared with the second
+    first = grouped_df.cumcount() == 0
+    partner_id = grouped_df['variant_id'].shift(-1).where(first,grouped_df['variant_id'].shift(1))
+    partner_chrom = grouped_df['chrom'].shift(-1).where(first,grouped_df['chrom'].shift(1))
+    pos = df['pos'].astype(int)
+    partner_pos = grouped_df['pos'].shift(-1).where(first,grouped_df['pos'].shift(1)).fillna(-1).astype(int)
+    pos1,pos2 = pos.where(first,partner_pos),partner_pos.where(first,pos)
+
+    # look for intra chom events that are out of order
+    swap = (size == 2) & (df['chrom'] == partner_chrom) & (pos1 > pos2)
+    df.loc[swap,'mate_id'] = df.loc[swap,'variant_id']
+    df.loc[swap,'variant_id'] = partner_id[swap]
+    df = df.sort_values(by='variant_id').reset_index(drop = True)
     # **
-    
-    outFile1 = out_dir + sample + '-manta_modified.txt'
-    with open(outFile1,'w') as out1:
-        # assemble and write yo header
-        header = ['sample','caller','event_id','variant_id','variant_type','chrom','pos','ref','alt','mate_id','tumor_discordant_rs','tumor_spanning_rs','tumor_dp','intra_chrom_event_length']
-        out1.write('\t'.join(header) + '\n')
 
-        if verbose:
-            print('modifying manta calls for compatibility ...',end='',flush=True)
-
-        for index,row in df.iterrows():
-            variant_type = row['variant_type']
-#            print(list(row))
-            if variant_type == 'BND':
-                lineOut = [str(field) for field in list(row)]
-                out1.write('\t'.join(lineOut) + '\n')
-            elif variant_type in ['DEL','DUP','INV']:
-                # write first entry
-                variant_id = row['variant_id']
-                row['variant_id'] = variant_id + '_bp1'
-                row['mate_id'] = variant_id + '_bp2'                
-                lineOut = [str(field) for field in list(row)]
-                out1.write('\t'.join(lineOut) + '\n')
-
-                # write first entry
-                row['variant_id'] = variant_id + '_bp2'
-                row['mate_id'] = variant_id + '_bp1'                                
-                event_length = int(row['intra_chrom_event_length'])
-                row['pos'] = str(int(row['pos']) + event_length)
-                lineOut = [str(field) for field in list(row)]
-                out1.write('\t'.join(lineOut) + '\n')
-            elif variant_type == 'INS':
-                # write first entry
-                variant_id = row['variant_id']
-                row['variant_id'] = variant_id + '_bp1'
-                row['mate_id'] = variant_id + '_bp2'                
-                lineOut = [str(field) for field in list(row)]
-                out1.write('\t'.join(lineOut) + '\n')
-
-                # write first entry
-                row['variant_id'] = variant_id + '_bp2'
-                row['mate_id'] = variant_id + '_bp1'                                
-                row['pos'] = str(int(row['pos']) + 1)
-                lineOut = [str(field) for field in list(row)]
-                out1.write('\t'.join(lineOut) + '\n')
-            else:
-                print(variant_type)
-                print(row)
-                raise 'i no understand'
+    if verbose:
+        print('modifying manta calls for compatibility ...',end='',flush=True)
+
+    variant_type = df['variant_type']
+    unknown = ~variant_type.isin(['BND','DEL','DUP','INV','INS'])
+    if unknown.any():
+        print(df[unknown])
+        raise Exception('i no understand manta variant types ' + ','.join(sorted(set(variant_type[unknown]))))
+
+    # ** expand del,dup,inv and ins events into 2 break points **
+    # bp2 is placed at the end of the event (or 1bp after an insertion) and rows are ordered bp1 then bp2 in place of the event
+    expand = variant_type != 'BND'
+    bp1 = df[expand].copy()
+    bp2 = df[expand].copy()
+    bp1['variant_id'],bp1['mate_id'] = bp1['variant_id'] + '_bp1',bp1['variant_id'] + '_bp2'
+    bp2['variant_id'],bp2['mate_id'] = bp2['variant_id'] + '_bp2',bp2['variant_id'] + '_bp1'
+    is_ins = bp2['variant_type'] == 'INS'
+    event_length = pd.to_numeric(bp2['intra_chrom_event_length'].where(~is_ins,'1')).astype(int)
+    bp2['pos'] = (bp2['pos'].astype(int) + event_length).astype(str)
+
+    df2 = pd.concat([df[~expand],bp1,bp2],axis=0)
+    df2['bp'] = [0] * (len(df2) - len(bp2)) + [1] * len(bp2)
+    df2 = df2.rename_axis('row').sort_values(by=['row','bp'],kind = 'stable').drop(columns = 'bp').reset_index(drop = True)
+    # **
 
     if verbose:                
         print('done')
-    return outFile1
+    return df2
+
+# *** confirm that fast reader decodes the same values as PyVCF ***
+# compares the fields that the caller parsers read and returns the number of mismatching records
+# records on non-standard contigs are skipped since they never reach the caller tables and PyVCF rewrites some of their alt contig names
+def check_parity(my_vcf,keys,verbose = True):
+    import vcf  # PyVCF only needed for parity checks
+
+    if verbose:
+        print('checking reader parity for ' + my_vcf + ' ...',end='',flush=True)
+
+    vcf_reader = vcf.Reader(filename=my_vcf)
+    with open_vcf(my_vcf) as in1:
+        header = read_header(in1)
+        assert header['samples'] == vcf_reader.samples
+
+        mismatches = 0
+        for vcf_record,fields in zip(vcf_reader,iter_records(in1)):
+            if reject_contig(fields[CHROM],fields[ALT]):
+                continue
+            alt = fields[ALT].split(',')[0]
+
+            # fields as the parsers read them
+            filters = fields[FILTER]
+            expected = [vcf_record.CHROM,vcf_record.POS,vcf_record.ID,vcf_record.REF,str(vcf_record.ALT[0]),vcf_record.FILTER,vcf_record.INFO]
+            observed = [fields[CHROM],int(fields[POS]),None if fields[ID] == '.' else fields[ID],fields[REF],alt,
+                        [] if filters == 'PASS' else (None if filters == '.' else filters.split(';')),parse_info(header,fields[INFO])]
+
+            for idx in range(len(header['samples'])):
+                data = vcf_record.samples[idx].data
+                expected.append({key:getattr(data,key) for key in keys if hasattr(data,key)})
+                observed.append(parse_sample(header,fields[FORMAT],fields[9 + idx],keys))
+
+            if expected != observed:
+                mismatches += 1
+                if verbose and mismatches <= 5:
+                    print('\nmismatch at ' + fields[CHROM] + ':' + fields[POS] + ' ' + fields[ID])
+                    print('PyVCF: ' + str(expected))
+                    print('fast:  ' + str(observed))
+
+    if verbose:
+        print('done' if mismatches == 0 else str(mismatches) + ' mismatching records!')
+    return mismatches
+# ***
 
 # *** determine which of the samples (if matched) are tumor ***
 # assumes higher discordant read count in the top x vcf calls
-def infer_tumor_idx(vcf_reader,caller):
-    num_calls = 30
+def infer_tumor_idx(header,records,caller):
     counts = {0:[],1:[]}
+    keys = caller_keys[caller]
 
-    call_count = 0
-    for vcf_record in vcf_reader:
+    for fields in records:
+        samples = [parse_sample(header,fields[FORMAT],fields[9 + idx],keys) for idx in range(0,2)]
         if caller == 'manta':
             for idx in range(0,2):
                 # first take from split read support 
-                if hasattr(vcf_record.samples[idx].data,'SR'):
-                    counts[idx].append(vcf_record.samples[idx].data.SR[1])
+                if 'SR' in samples[idx]:
+                    counts[idx].append(samples[idx]['SR'][1])
                 else:
                     # else take from paired read support
-                    assert hasattr(vcf_record.samples[idx].data,'PR')
-                    counts[idx].append(vcf_record.samples[idx].data.PR[1])
+                    assert 'PR' in samples[idx]
+                    counts[idx].append(samples[idx]['PR'][1])
         elif caller == 'svaba':
             for idx in range(0,2):
                 # first take from discordant read support if there is any
-                if vcf_record.samples[idx].data.DR != 0:
-                    counts[idx].append(vcf_record.samples[idx].data.DR)
+                if samples[idx]['DR'] != 0:
+                    counts[idx].append(samples[idx]['DR'])
                 else:
                     # otherwise take from ad
-                    counts[idx].append(vcf_record.samples[idx].data.AD)
+                    counts[idx].append(samples[idx]['AD'])
         elif caller == 'gridss':
             for idx in range(0,2):
                 # first take from discordant read support if there is any
-                if vcf_record.samples[idx].data.SR != 0:
-                    counts[idx].append(vcf_record.samples[idx].data.SR)
+                if samples[idx]['SR'] != 0:
+                    counts[idx].append(samples[idx]['SR'])
                 else:
                     # otherwise take from ad
-                    counts[idx].append(vcf_record.samples[idx].data.VF)
+                    counts[idx].append(samples[idx]['VF'])
         else:
             raise 'i no understand now to infer_tumor_idx for this caller'
-        
-        # read the top x calls
-        call_count += 1
-        if call_count >= num_calls:
-            break
 
     # sum then and return the index that has more
     sums = {0:0,1:0}
     for my_key in sums.keys():
-        for idx in range(num_calls):
-            sums[my_key] += counts[my_key][idx]
+        for value in counts[my_key]:
+            sums[my_key] += value
 
     # throw a warning if second genotype is not selected
     larger_idx = 1 if sums[1] > sums[0] else 0
@@ -198,292 +330,249 @@ def infer_tumor_idx(vcf_reader,caller):
     return larger_idx
 
 # *** parse manta vcf and return df ***
-def parse_manta(my_vcf,out_dir,sample,verbose,numSVs):
-    outFile1 = out_dir + sample + '-manta.txt'
-    with open(outFile1,'w') as out1:
-        # assemble and write yo header
-        header = ['sample','caller','event_id','variant_id','variant_type','chrom','pos','ref','alt','mate_id','tumor_discordant_rs','tumor_spanning_rs','tumor_dp','intra_chrom_event_length']
-        out1.write('\t'.join(header) + '\n')
+def parse_manta(my_vcf,vcf_header,vcf_records,tumor_idx,sample,verbose,numSVs):
+    # assemble yo header and table columns
+    header = ['sample','caller','event_id','variant_id','variant_type','chrom','pos','ref','alt','mate_id','tumor_discordant_rs','tumor_spanning_rs','tumor_dp','intra_chrom_event_length']
+    columns = {field:[] for field in header}
+
+    if verbose:
+        print('parsing ' + my_vcf + ' ...',end='',flush=True)
+
+    # iterate and read through vcf records
+    count = 0
+    skipped = {'filter':0,'chrom':0,'alt':0}
+    for fields in vcf_records:
+        count += 1
+
+        # skip non-passing records
+        if fields[FILTER] not in ['PASS','.']:
+            skipped['filter'] += 1
+            continue
+
+        # only show standard chroms - checked on raw text so rejected records are never decoded
+        stage = reject_contig(fields[CHROM],fields[ALT])
+        if stage:
+            skipped[stage] += 1
+            continue
+
+        record = {'sample':sample,'caller':'manta'}
+        info = parse_info(vcf_header,fields[INFO])
+        
+        record['variant_id'] = fields[ID]
+        record['variant_type'] = info['SVTYPE']
+        record['chrom'],record['pos'],record['ref'],record['alt'] = fields[CHROM],fields[POS],fields[REF],fields[ALT]
+        record['alt'] = record['alt'].split(',')[0]
 
-        if verbose:
-            print('parsing ' + my_vcf + ' ...',end='',flush=True)
+        record['mate_id'] = 'NA' if 'MATEID' not in info else info['MATEID'][0]
 
-        # determine which genotype field to read from as tumor
-        vcf_reader = vcf.Reader(filename=my_vcf)        
-        assert len(vcf_reader.samples) in [1,2]
-        if len(vcf_reader.samples) == 1:
-            tumor_idx = 0
+        # event_id should uniquely represent each bnd pair and other events
+        if 'EVENT' in fields[ID]:
+            record['event_id'] = fields[ID]
         else:
-            # since tumor may not always be last, confirm that it is and throw an warning if it's not
-            tumor_idx = infer_tumor_idx(vcf_reader, 'manta')
+            ids = sorted([record['variant_id'],record['mate_id']])
+            ids = [id for id in ids if id != 'NA']
+            record['event_id'] = ids[0]
+        
+        # get read support info for tumor only for easy support of both tumor and tumor vs normal
+        # for manta SR is split read support - analogous to spanning read support for svaba
+        data = parse_sample(vcf_header,fields[FORMAT],fields[9 + tumor_idx],caller_keys['manta'])
+        if 'SR' in data:
+            values = data['SR']
+            record['tumor_spanning_rs'] = values[1]
+        else:
+            record['tumor_spanning_rs'] = 0
 
-        # iterate and read through vcf records
-        count = 0
-        vcf_reader = vcf.Reader(filename=my_vcf)            
-        for vcf_record in vcf_reader:
-            count += 1
-            record = {'sample':sample,'caller':'manta'}
+        # for manta PR is paired read support - analogous to discordant read support for svaba                
+        if 'PR' in data:
+            values = data['PR']
+            record['tumor_discordant_rs'] = values[1]
+        else:
+            record['tumor_discordant_rs'] = 0
 
-            info = vcf_record.INFO
+        # get some informatio about read depth
+        # for bnd depth is provided
+        if 'BND_DEPTH' in info:
+            record['tumor_dp'] = info['BND_DEPTH']
+        # for everything else we use total spanning reads and discordant reads
+        else:
+            values1 = data['PR']
+            values2 = [0,0] if 'SR' not in data else data['SR']
+            record['tumor_dp'] = int(values1[0]) + int(values1[1]) + int(values2[0]) + int(values2[1])
+
+        # attempt to infer intra chrom length...
+        record['intra_chrom_event_length'] = 'NA' if 'SVLEN' not in info else str(abs(int(info['SVLEN'][0])))
+        if record['intra_chrom_event_length'] == 'NA' and record['variant_type'] == 'INS':
+            record['intra_chrom_event_length'] == 0
+        elif record['intra_chrom_event_length'] == 'NA' and record['variant_type'] == 'BND':
+            result = re.findall('.*(chr[0-9XYM]+)[:]([0-9]+)',record['alt'])
+            assert len(result) == 1 and len(result[0]) == 2
+            alt_chrom,alt_pos = result[0][0],result[0][1]
+
+            if record['chrom'] != alt_chrom:
+                record['intra_chrom_event_length'] = -1
+            else:
+                record['intra_chrom_event_length'] = abs(int(record['pos']) - int(alt_pos))
+        
+        # add record to table columns
+        for field in header:
+            columns[field].append(str(record[field]))
 
-            # skip non-passing records - if PASS then filter returns empty list
-            if len(vcf_record.FILTER) != 0:
-                continue
+        # end early if testing
+        if numSVs != -1 and count >= numSVs:
+            break
             
-            record['variant_id'] = vcf_record.ID            
-            record['variant_type'] = info['SVTYPE']
-            record['chrom'],record['pos'],record['ref'],record['alt'] = vcf_record.CHROM,vcf_record.POS,vcf_record.REF,vcf_record.ALT
-            record['alt'] = str(record['alt'][0])
-
-            # only show standard chroms
-            if record['chrom'] in chroms and 'chrUn' not in record['alt'] and 'alt' not in record['alt'] and 'random' not in record['alt'] and 'HLA-' not in record['alt']:
-                record['mate_id'] = 'NA' if 'MATEID' not in info else info['MATEID'][0]
-
-                # event_id should uniquely represent each bnd pair and other events
-                if 'EVENT' in vcf_record.ID:
-                    record['event_id'] = vcf_record.ID
-                else:
-                    ids = sorted([record['variant_id'],record['mate_id']])
-                    ids = [id for id in ids if id != 'NA']
-                    record['event_id'] = ids[0]
-                
-                # get read support info for tumor only for easy support of both tumor and tumor vs normal
-                # for manta SR is split read support - analogous to spanning read support for svaba
-                if hasattr(vcf_record.samples[tumor_idx].data,'SR'):
-                    values = vcf_record.samples[tumor_idx].data.SR
-                    record['tumor_spanning_rs'] = values[1]
-                else:
-                    record['tumor_spanning_rs'] = 0
-
-                # for manta PR is paired read support - analogous to discordant read support for svaba                
-                if hasattr(vcf_record.samples[tumor_idx].data,'PR'):
-                    values = vcf_record.samples[tumor_idx].data.PR
-                    record['tumor_discordant_rs'] = values[1]
-                else:
-                    record['tumor_discordant_rs'] = 0
-
-                # get some informatio about read depth
-                # for bnd depth is provided
-                if 'BND_DEPTH' in info:
-                    record['tumor_dp'] = info['BND_DEPTH']
-                # for everything else we use total spanning reads and discordant reads
-                else:
-                    values1 = vcf_record.samples[tumor_idx].data.PR
-                    values2 = [0,0] if not hasattr(vcf_record.samples[tumor_idx].data,'SR') else vcf_record.samples[tumor_idx].data.SR
-                    record['tumor_dp'] = int(values1[0]) + int(values1[1]) + int(values2[0]) + int(values2[1])
-
-                # attempt to infer intra chrom length...
-                record['intra_chrom_event_length'] = 'NA' if 'SVLEN' not in info else str(abs(int(info['SVLEN'][0])))
-                if record['intra_chrom_event_length'] == 'NA' and record['variant_type'] == 'INS':
-                    record['intra_chrom_event_length'] == 0
-                elif record['intra_chrom_event_length'] == 'NA' and record['variant_type'] == 'BND':
-                    result = re.findall('.*(chr[0-9XYM]+)[:]([0-9]+)',record['alt'])
-                    assert len(result) == 1 and len(result[0]) == 2
-                    alt_chrom,alt_pos = result[0][0],result[0][1]
-
-                    if record['chrom'] != alt_chrom:
-                        record['intra_chrom_event_length'] = -1
-                    else:
-                        record['intra_chrom_event_length'] = abs(int(record['pos']) - int(alt_pos))
-                
-                # assemble and write line out
-                lineOut = []
-                for field in header:
-                    lineOut.append(str(record[field]))
-                out1.write('\t'.join(lineOut) + '\n')
-
-                # end early if testing
-                if numSVs != -1 and count >= numSVs:
-                    break
-                
     if verbose:                
-        print('done')
-    return outFile1
+        print('done' + report_skipped(skipped))
+    return pd.DataFrame(columns,columns = header,dtype = object)
 # ***
     
 # *** parse svaba sv vcf ***
-def parse_svaba(my_vcf,out_dir,sample,verbose,multi_svaba,numSVs):
+def parse_svaba(my_vcf,vcf_header,vcf_records,tumor_idx,sample,verbose,numSVs):
 
     vcf_type = 'sv' if 'sv.vcf' in my_vcf else 'indel'
-    flag = 'w' if vcf_type == 'indel' or not multi_svaba else 'a'
     
-    outFile1 = out_dir + sample + '-svaba.txt'
-    with open(outFile1,flag) as out1:
-        header = ['sample','caller','event_id','variant_id','variant_type','chrom','pos','ref','alt','mate_id','tumor_discordant_rs','tumor_spanning_rs','tumor_dp','intra_chrom_event_length']
-
-        # indel and sv vcfs for svaba so we need to check if file has already been created else create a header...        
-        if flag == 'w':
-            # assemble and write yo header
-            out1.write('\t'.join(header) + '\n')
-        if verbose:
-            print('parsing ' + my_vcf + ' ...',end='',flush=True)    
-        vcf_reader = vcf.Reader(filename=my_vcf)
+    # assemble yo header and table columns
+    header = ['sample','caller','event_id','variant_id','variant_type','chrom','pos','ref','alt','mate_id','tumor_discordant_rs','tumor_spanning_rs','tumor_dp','intra_chrom_event_length']
+    columns = {field:[] for field in header}
 
-        # determine which genotype field to read from as tumor
-        vcf_reader = vcf.Reader(filename=my_vcf)        
-        assert len(vcf_reader.samples) in [1,2]
-        if len(vcf_reader.samples) == 1:
-            tumor_idx = 0
-        else:
-            # since tumor may not always be last, confirm that it is and throw an warning if it's not
-            tumor_idx = infer_tumor_idx(vcf_reader, 'svaba')
-
-        # iterate and read through vcf records
-        count = 0
-        vcf_reader = vcf.Reader(filename=my_vcf)
-        for vcf_record in vcf_reader:
-            count += 1
-            record = {'sample':sample,'caller':'svaba'}
-
-            info = vcf_record.INFO
-
-            record['variant_type'] = 'INDEL' if vcf_type == 'indel' else info['SVTYPE']
-            record['variant_id'] = vcf_record.ID
-            record['chrom'],record['pos'],record['ref'],record['alt'] = vcf_record.CHROM,vcf_record.POS,vcf_record.REF,vcf_record.ALT
-            record['alt'] = str(record['alt'][0])
-
-            if record['chrom'] in chroms and 'chrUn' not in record['alt'] and 'alt' not in record['alt'] and 'random' not in record['alt'] and 'HLA-' not in record['alt']:            
-                record['mate_id'] = 'NA' if 'MATEID' not in info else info['MATEID']
-
-                # get event_id
-                ids = sorted([record['variant_id'],record['mate_id']])
-                ids = [id for id in ids if id != 'NA']
-                record['event_id'] = ids[0]
-
-                
-                record['intra_chrom_event_length'] = 'NA' if 'SPAN' not in info else info['SPAN']
-
-                # get genotype support information for tumor sample
-                # leaving out normal support for now
-                vcf_samples = vcf_record.samples
-                vcf_sample = vcf_record.samples[tumor_idx]
-
-                record['tumor_discordant_rs'] = vcf_sample.data.AD if not hasattr(vcf_sample.data,'DR') else vcf_sample.data.DR  # AD is used for indels where we don't have dr
-                record['tumor_spanning_rs'] = vcf_sample.data.SR                
-                record['tumor_dp'] = vcf_sample.data.DP
-
-                # assemble and write line out
-                lineOut = []
-                for field in header:
-                    lineOut.append(str(record[field]))
-                out1.write('\t'.join(lineOut) + '\n')
-
-                # end early if testing
-                if numSVs != -1 and count >= numSVs:
-                    break
+    if verbose:
+        print('parsing ' + my_vcf + ' ...',end='',flush=True)    
+
+    # iterate and read through vcf records
+    count = 0
+    skipped = {'chrom':0,'alt':0}
+    for fields in vcf_records:
+        count += 1
+
+        # only show standard chroms - checked on raw text so rejected records are never decoded
+        stage = reject_contig(fields[CHROM],fields[ALT])
+        if stage:
+            skipped[stage] += 1
+            continue
+
+        record = {'sample':sample,'caller':'svaba'}
+        info = parse_info(vcf_header,fields[INFO])
+
+        record['variant_type'] = 'INDEL' if vcf_type == 'indel' else info['SVTYPE']
+        record['variant_id'] = fields[ID]
+        record['chrom'],record['pos'],record['ref'],record['alt'] = fields[CHROM],fields[POS],fields[REF],fields[ALT]
+        record['alt'] = record['alt'].split(',')[0]
+
+        record['mate_id'] = 'NA' if 'MATEID' not in info else info['MATEID']
+
+        # get event_id
+        ids = sorted([record['variant_id'],record['mate_id']])
+        ids = [id for id in ids if id != 'NA']
+        record['event_id'] = ids[0]
+
+        
+        record['intra_chrom_event_length'] = 'NA' if 'SPAN' not in info else info['SPAN']
+
+        # get genotype support information for tumor sample
+        # leaving out normal support for now
+        data = parse_sample(vcf_header,fields[FORMAT],fields[9 + tumor_idx],caller_keys['svaba'])
+
+        record['tumor_discordant_rs'] = data['AD'] if 'DR' not in data else data['DR']  # AD is used for indels where we don't have dr
+        record['tumor_spanning_rs'] = data['SR']
+        record['tumor_dp'] = data['DP']
+
+        # add record to table columns
+        for field in header:
+            columns[field].append(str(record[field]))
+
+        # end early if testing
+        if numSVs != -1 and count >= numSVs:
+            break
     if verbose:                
-        print('done')                
-    return outFile1
+        print('done' + report_skipped(skipped))              
+    return pd.DataFrame(columns,columns = header,dtype = object)
 # *** end svaba SV parsing ***
 
 # *** parse gridss sv vcf ***
-def parse_gridss(my_vcf,out_dir,sample,verbose,numSVs):
+def parse_gridss(my_vcf,vcf_header,vcf_records,tumor_idx,sample,verbose,numSVs):
+
+    # assemble yo header and table columns
+    header = ['sample','caller','event_id','variant_id','variant_type','chrom','pos','ref','alt','mate_id','tumor_discordant_rs','tumor_spanning_rs','tumor_dp','intra_chrom_event_length']
+    columns = {field:[] for field in header}
+
+    if verbose:
+        print('parsing ' + my_vcf + ' ...',end='',flush=True)    
+
+    # iterate and read through vcf records
+    count = 0
+    skipped = {'chrom':0,'alt':0}
+    for fields in vcf_records:
+        count += 1
+
+        # only show standard chroms - checked on raw text so rejected records are never decoded
+        stage = reject_contig(fields[CHROM],fields[ALT])
+        if stage:
+            skipped[stage] += 1
+            continue
+
+        record = {'sample':sample,'caller':'gridss'}
+        info = parse_info(vcf_header,fields[INFO])
+
+        record['variant_type'] = info['SVTYPE']
+        record['variant_id'] = fields[ID]
+
+        record['chrom'],record['pos'],record['ref'],record['alt'] = fields[CHROM],fields[POS],fields[REF],fields[ALT]
+        record['alt'] = record['alt'].split(',')[0]
 
-    outFile1 = out_dir + sample + '-gridss.txt'
-    with open(outFile1,'w') as out1:
-        header = ['sample','caller','event_id','variant_id','variant_type','chrom','pos','ref','alt','mate_id','tumor_discordant_rs','tumor_spanning_rs','tumor_dp','intra_chrom_event_length']
+        record['mate_id'] = 'NA' if 'MATEID' not in info else info['MATEID'][0]
 
-        # assemble and write yo header
-        out1.write('\t'.join(header) + '\n')
+        # get event_id
+        record['event_id'] = info['EVENT']
         
-        if verbose:
-            print('parsing ' + my_vcf + ' ...',end='',flush=True)    
-        vcf_reader = vcf.Reader(filename=my_vcf)
+        record['intra_chrom_event_length'] = 'NA' # needs to be filled in later
 
-        # determine which genotype field to read from as tumor
-        vcf_reader = vcf.Reader(filename=my_vcf)        
-        assert len(vcf_reader.samples) in [1,2]
-        if len(vcf_reader.samples) == 1:
-            tumor_idx = 0
-        else:
-            # since tumor may not always be last, confirm that it is and throw a warning if it's not
-            tumor_idx = infer_tumor_idx(vcf_reader, 'gridss')
-
-        # iterate and read through vcf records
-        count = 0
-        records = {}
-        event2variants = {}
-        allVariants = []
-        vcf_reader = vcf.Reader(filename=my_vcf)
-        for vcf_record in vcf_reader:
-            count += 1
-            record = {'sample':sample,'caller':'gridss'}
-
-            info = vcf_record.INFO
-
-            record['variant_type'] = info['SVTYPE']
-            record['variant_id'] = vcf_record.ID
-            variant_id = record['variant_id']
-
-            record['chrom'],record['pos'],record['ref'],record['alt'] = vcf_record.CHROM,vcf_record.POS,vcf_record.REF,vcf_record.ALT
-            record['alt'] = str(record['alt'][0])
-
-            if record['chrom'] in chroms and 'chrUn' not in record['alt'] and 'alt' not in record['alt'] and 'random' not in record['alt'] and 'HLA-' not in record['alt']:            
-                record['mate_id'] = 'NA' if 'MATEID' not in info else info['MATEID'][0]
-
-                # get event_id
-                record['event_id'] = info['EVENT']
-                event_id = record['event_id']
-                
-                record['intra_chrom_event_length'] = 'NA' # needs to be filled in later
-
-                # get genotype support information for tumor sample
-                # leaving out normal support for now
-                vcf_samples = vcf_record.samples
-                vcf_sample = vcf_record.samples[tumor_idx]
-
-                record['tumor_discordant_rs'] = vcf_sample.data.SR
-                record['tumor_spanning_rs'] = vcf_sample.data.VF  # note this is fragment support - labeling as rs for consistency 
-                record['tumor_dp'] = vcf_sample.data.REF
-
-                # assemble and add lineOut dictionary to records to be converted to data frame
-                lineOut = []
-                for field in header:
-                    lineOut.append(str(record[field]))
-                lineDict = dict(zip(header,lineOut))
-                records[variant_id] = lineDict                
-
-                # ** keep track of event and associated variants to fix missing span and potential order issues **
-                allVariants.append(variant_id)                
-                if event_id not in event2variants:
-                    event2variants[event_id] = [variant_id]
-                else:
-                    event2variants[event_id] = sorted(event2variants[event_id] + [variant_id])
-                    variants = event2variants[event_id]
-
-                    if len(variants) == 2:
-                        variant1,variant2 = variants
-                        
-                        # Extract values for comparison
-                        chrom1,chrom2 = records[variant1]['chrom'],records[variant2]['chrom']
-                        pos1,pos2 = records[variant1]['pos'],records[variant2]['pos']                        
-                        span = -1 if chrom1 != chrom2 else str(abs(int(pos1) - int(pos2)))
-
-                        records[variant1]['intra_chrom_event_length'] = span
-                        records[variant2]['intra_chrom_event_length'] = span
-
-                        if chrom1 == chrom2 and int(pos1) > int(pos2):
-                            records[variant1]['variant_id'] = variant2
-                            records[variant2]['variant_id'] = variant1
-                            records[variant1]['mate_id'] = variant1
-                            records[variant2]['mate_id'] = variant2                            
-                            
-                # end early if testing
-                if numSVs != -1 and count >= numSVs:
-                    break
-
-    # yo load into a df and write it yo
-    records2 = []
-    for variant in allVariants:
-        records2.append(records[variant])
-    df = pd.DataFrame(records2)
-    df = df.sort_values(by='variant_id') 
-    df.to_csv(outFile1,sep="\t",index = False)
+        # get genotype support information for tumor sample
+        # leaving out normal support for now
+        data = parse_sample(vcf_header,fields[FORMAT],fields[9 + tumor_idx],caller_keys['gridss'])
+
+        record['tumor_discordant_rs'] = data['SR']
+        record['tumor_spanning_rs'] = data['VF']  # note this is fragment support - labeling as rs for consistency 
+        record['tumor_dp'] = data['REF']
+
+        # add record to table columns
+        for field in header:
+            columns[field].append(str(record[field]))
+
+        # end early if testing
+        if numSVs != -1 and count >= numSVs:
+            break
+
+    # ** pair variants by event to fix missing span and potential order issues **
+    # the first 2 variants seen for an event are paired and compared in variant_id order
+    df = pd.DataFrame(columns,columns = header,dtype = object)
+    grouped_df = df.groupby('event_id',sort = False)
+    order = grouped_df.cumcount()
+    first = order == 0
+    paired = (order <= 1) & (grouped_df['variant_id'].transform('size') >= 2)
+
+    partner_id = grouped_df['variant_id'].shift(-1).where(first,grouped_df['variant_id'].shift(1))
+    partner_chrom = grouped_df['chrom'].shift(-1).where(first,grouped_df['chrom'].shift(1))
+    pos = df['pos'].astype(int)
+    partner_pos = grouped_df['pos'].shift(-1).where(first,grouped_df['pos'].shift(1)).fillna(-1).astype(int)
+    is_variant1 = df['variant_id'] < partner_id
+    pos1,pos2 = pos.where(is_variant1,partner_pos),partner_pos.where(is_variant1,pos)
+
+    intra = paired & (df['chrom'] == partner_chrom)
+    df.loc[paired,'intra_chrom_event_length'] = '-1'
+    df.loc[intra,'intra_chrom_event_length'] = (pos - partner_pos).abs()[intra].astype(str)
+
+    swap = intra & (pos1 > pos2)
+    df.loc[swap,'mate_id'] = df.loc[swap,'variant_id']
+    df.loc[swap,'variant_id'] = partner_id[swap]
+    # **
+
+    # yo load into a df
+    df = df.sort_values(by='variant_id').reset_index(drop = True)
 
     if verbose:                
-        print('done')
+        print('done' + report_skipped(skipped))
 
-    return outFile1
+    return df
 # *** end gridss SV parsing ***
 
         
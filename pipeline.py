@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# per sample pipeline - parse, dedup, compare, select and merge
+# shared by sv-merge.py for one sample and sv-merge-batch.py for a cohort
+
+import pandas as pd
+from parse import parse_vcfs,apply_schema,is_multi_svaba
+from compare import compare,rankCallers
+from merge import merge
+from dedup import dedup
+from utils import wait_for_writes,internIDs,pairEvents
+from selection import select
+from store import caller_keys,load_store,save_store
+from cache import cache_key
+
+# *** run every step for one sample ***
+# with match_store the svs, dups and matches are kept in outdir/sample-store/ and a rerun only parses, dedups and
+# matches callers whose vcfs were added or replaced - select and merge always run on the full match graph
+def run_sample(vcf_list,out_dir,sample,slack,recipOverlap,verbose,caller_order,numSVs=-1,check_parity=False,jobs=1,write_tables=True,regions=None,cache_dir=None,cache_bytes=0,match_store=False,vcf_index='F'):
+    vcf_list = sorted(vcf_list)
+    multi_svaba = is_multi_svaba(vcf_list)
+
+    # cache keys from file stats computed once - shared by the parse cache and the match store
+    vcf_keys = [cache_key(my_vcf,sample,numSVs,multi_svaba,regions) for my_vcf in vcf_list] if match_store or cache_dir != None else None
+
+    # ** callers and matches kept from an earlier run **
+    knownSVs,knownMatches = dict(),dict()
+    if match_store:
+        store_dir = out_dir + sample + '-store/'
+        vcfCallers,keys = caller_keys(vcf_list,vcf_keys,store_dir)
+        knownSVs,knownMatches = load_store(store_dir,keys,slack,recipOverlap)
+        if verbose and len(knownSVs) > 0:
+            print('loaded stored calls for ' + ','.join(sorted(knownSVs.keys())) + ' and matches for ' + str(len(knownMatches)) + ' caller pairs')
+    # **
+
+    # parse vcfs of callers that are not stored
+    if len(knownSVs) > 0:
+        to_parse = [idx for idx,caller in enumerate(vcfCallers) if caller not in knownSVs]
+        tables = {caller:df.drop(columns = ['id','isDup']) for caller,df in knownSVs.items()}
+        if len(to_parse) > 0:
+            df_new = parse_vcfs([vcf_list[idx] for idx in to_parse],out_dir,sample,numSVs,verbose,check_parity,jobs,write_tables,regions,cache_dir,cache_bytes,multi_svaba,[vcf_keys[idx] for idx in to_parse])
+            tables.update({caller:df.drop(columns = 'id') for caller,df in df_new.groupby('caller',observed = True)})
+
+        # combined table in the caller order parsing gives
+        df_all = apply_schema(pd.concat([tables[caller] for caller in sorted(tables.keys())],axis=0,ignore_index = True))
+        df_all['id'] = df_all['sample'].astype(str) + '__' + df_all['caller'].astype(str) + '__' + df_all['event_id']
+    else:
+        df_all = parse_vcfs(vcf_list,out_dir,sample,numSVs,verbose,check_parity,jobs,write_tables,regions,cache_dir,cache_bytes,multi_svaba,vcf_keys)
+
+    # intern sv ids and pair break points once - shared by dedup, compare, select and merge
+    ids = internIDs(df_all)
+    pairs = pairEvents(df_all,ids,verbose)
+
+    # mark duplicate calls - dups of stored callers are taken from the store
+    knownDups = {caller:df.loc[df['isDup'] == 'Y','id'] for caller,df in knownSVs.items()}
+    df_all = dedup(df_all,ids,pairs,out_dir,sample,slack,recipOverlap,verbose,jobs,knownDups)
+
+#    df_all = pd.read_csv('intermediate/02/results/LNCaP_APIPC-svs.txt',sep="\t")  # for testing
+
+    if len(vcf_list) > 1:  # only possible to compare more than 1 vcf
+        # compare calls
+        dfMatches1 = compare(df_all,ids,pairs,out_dir,sample,caller_order,slack,recipOverlap,verbose,jobs,knownMatches)
+        if match_store:
+            ranked = rankCallers(sorted(df_all['caller'].unique()),caller_order)
+            callerPairs = [[caller,caller_b] for rank,caller in enumerate(ranked) for caller_b in ranked[rank + 1:]]
+            save_store(store_dir,keys,df_all,ids,dfMatches1,callerPairs,slack,recipOverlap)
+
+        # select matches to merge on (deal with multimatching)
+#        dfMatches1 = pd.read_csv('intermediate/02/results/LNCaP_APIPC-matches1.txt',sep="\t")   # for testing
+        dfMatches2 = select(dfMatches1,ids,out_dir,sample,caller_order,verbose,jobs)
+
+        # merge calls to be
+#        dfMatches2 = pd.read_csv('intermediate/02/results/LNCaP_APIPC-matches2.txt',sep="\t")   # for testing
+        merge(df_all,ids,dfMatches2,out_dir,sample,verbose,caller_order,vcf_index)
+    elif match_store:
+        save_store(store_dir,keys,df_all,ids,None,[],slack,recipOverlap)
+
+    # make sure background table writes are finished
+    wait_for_writes()
+# ***
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# lightweight streaming vcf reader - tokenizes raw lines and only decodes the fields that are asked for
+# values are converted the same way PyVCF converts them so parsed tables are unchanged
+
+import gzip,re,os,io,struct,bisect
+
+# column indexes for tokenized vcf records
+CHROM,POS,ID,REF,ALT,QUAL,FILTER,INFO,FORMAT = range(9)
+
+meta_pattern = re.compile(r'##(INFO|FORMAT)=<ID=([^,]+),Number=([^,]+),Type=([^,]+)')
+mate_pattern = re.compile(r'[\[\]]<?([^\[\]<>:]+)>?:([0-9]+)[\[\]]')
+
+# *** open plain or gzip/bgzip compressed vcf for reading text ***
+def open_vcf(my_vcf):
+    with open(my_vcf,'rb') as in1:
+        magic = in1.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(my_vcf,'rt')
+    return open(my_vcf)
+# ***
+
+# *** read meta lines and column header - leaves file positioned at the first record ***
+def read_header(in1):
+    header = {'lines':[],'samples':[],'infos':{},'formats':{}}
+    for line in in1:
+        line = line.rstrip('\n')
+        if line.startswith('##'):
+            header['lines'].append(line)
+            result = meta_pattern.match(line)
+            if result:
+                field_type,id,num,value_type = result.groups()
+                num = 1 if num == '1' else num
+                if field_type == 'INFO':
+                    header['infos'][id] = (num,value_type)
+                else:
+                    header['formats'][id] = (num,value_type)
+        elif line.startswith('#'):
+            header['lines'].append(line)
+            header['samples'] = line.split('\t')[9:]
+            break
+    return header
+# ***
+
+# *** yield tokenized records ***
+def iter_records(in1):
+    for line in in1:
+        if line == '\n' or line.startswith('#'):
+            continue
+        yield line.rstrip('\n').split('\t')
+# ***
+
+# ** convert a single value by header type - missing values become None **
+def convert_value(value,value_type):
+    if value == '.' or value == '':
+        return None
+    if value_type == 'Integer':
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    elif value_type == 'Float':
+        return float(value)
+    return value
+# **
+
+# *** decode INFO column to dict ***
+def parse_info(header,info_field):
+    info = dict()
+    if info_field == '.':
+        return info
+    for entry in info_field.split(';'):
+        key,sep,value = entry.partition('=')
+        num,value_type = header['infos'].get(key,(None,'String' if sep else 'Flag'))
+        if value_type == 'Flag':
+            info[key] = True
+            continue
+        values = [convert_value(val,value_type) for val in value.split(',')]
+        info[key] = values[0] if num == 1 else values
+    return info
+# ***
+
+# *** decode selected FORMAT keys for a sample - keys missing from FORMAT are left out ***
+def parse_sample(header,format_field,sample_field,keys):
+    data = dict()
+    format_keys = format_field.split(':')
+    values = sample_field.split(':')
+    for idx,key in enumerate(format_keys):
+        if key not in keys:
+            continue
+        value = values[idx] if idx < len(values) else '.'
+        value_type = header['formats'].get(key,(None,'String'))[1]
+        if ',' in value:
+            data[key] = [convert_value(val,value_type) for val in value.split(',')]
+        else:
+            data[key] = convert_value(value,value_type)
+    return data
+# ***
+
+# *** parse regions from a bed file or a comma separated chr:start-end list ***
+# returns chrom -> sorted and merged list of 1-based inclusive (start,end) intervals
+def read_regions(regions):
+    intervals = dict()
+    if os.path.exists(regions):
+        with open(regions) as in1:
+            for line in in1:
+                if line.strip() == '' or line.startswith(('#','track','browser')):
+                    continue
+                chrom,start,end = line.split('\t')[:3]
+                intervals.setdefault(chrom,[]).append((int(start) + 1,int(end)))  # bed is 0-based half open
+    else:
+        for region in regions.split(','):
+            chrom,sep,span = region.partition(':')
+            start,end = span.split('-') if sep else (1,2**31 - 1)
+            intervals.setdefault(chrom,[]).append((int(start),int(end)))
+
+    # merge overlapping intervals so lookups and fetches see each position once
+    for chrom in intervals:
+        merged = []
+        for start,end in sorted(intervals[chrom]):
+            if len(merged) > 0 and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0],max(merged[-1][1],end))
+            else:
+                merged.append((start,end))
+        intervals[chrom] = merged
+    return intervals
+# ***
+
+# ** check if a position falls in regions **
+def in_regions(regions,chrom,pos):
+    if chrom not in regions:
+        return False
+    idx = bisect.bisect_right(regions[chrom],(pos,2**31)) - 1
+    return idx >= 0 and regions[chrom][idx][1] >= pos
+# **
+
+# ** a record is kept if it is in regions or it is a breakend whose mate is in regions so breakend pairs stay complete **
+def keep_record(regions,fields):
+    if in_regions(regions,fields[CHROM],int(fields[POS])):
+        return True
+    result = mate_pattern.search(fields[ALT])
+    return result != None and in_regions(regions,result.group(1),int(result.group(2)))
+# **
+
+# *** read a tabix (.tbi) or coordinate sorted (.csi) index for a bgzipped vcf ***
+# returns contig names and per contig bins of (begin,end) virtual offset chunks along with the binning scheme
+# per contig the tbi linear index or the csi bin loffsets give the first record that can overlap a position
+def read_index(index_file):
+    with gzip.open(index_file,'rb') as in1:
+        data = in1.read()
+    magic = data[:4]
+    if magic == b'TBI\x01':
+        min_shift,depth = 14,5
+        n_ref, = struct.unpack_from('<i',data,4)
+        l_nm, = struct.unpack_from('<i',data,32)  # after format,col_seq,col_beg,col_end,meta,skip
+        offset = 36
+        names = data[offset:offset + l_nm].split(b'\x00')[:n_ref]
+        offset += l_nm
+    elif magic == b'CSI\x01':
+        min_shift,depth,l_aux = struct.unpack_from('<iii',data,4)
+        aux = data[16:16 + l_aux]
+        names = aux[28:].split(b'\x00') if l_aux >= 28 else []
+        offset = 16 + l_aux
+        n_ref, = struct.unpack_from('<i',data,offset)
+        names = names[:n_ref]
+        offset += 4
+    else:
+        raise Exception('i no understand index format for ' + index_file)
+
+    refs,linear,loffsets = [],[],[]
+    for ref in range(n_ref):
+        bins,bin_loffsets = dict(),dict()
+        n_bin, = struct.unpack_from('<i',data,offset)
+        offset += 4
+        for idx in range(n_bin):
+            if magic == b'TBI\x01':
+                bin,n_chunk = struct.unpack_from('<Ii',data,offset)
+                offset += 8
+            else:
+                bin,loffset,n_chunk = struct.unpack_from('<IQi',data,offset)
+                bin_loffsets[bin] = loffset
+                offset += 16
+            chunks = struct.unpack_from('<' + 'Q' * 2 * n_chunk,data,offset)
+            offset += 16 * n_chunk
+            bins[bin] = list(zip(chunks[0::2],chunks[1::2]))
+        if magic == b'TBI\x01':
+            n_intv, = struct.unpack_from('<i',data,offset)
+            linear.append(list(struct.unpack_from('<' + 'Q' * n_intv,data,offset + 4)))
+            offset += 4 + 8 * n_intv
+        refs.append(bins)
+        loffsets.append(bin_loffsets)
+    return {'names':[name.decode() for name in names],'refs':refs,'min_shift':min_shift,'depth':depth,'linear':linear,'loffsets':loffsets}
+# ***
+
+# ** bins overlapping a 0-based half open interval **
+def reg2bins(beg,end,min_shift,depth):
+    bins = []
+    end = min(end,1 << (min_shift + depth * 3)) - 1  # clamp to the span covered by the index
+    level,first,shift = 0,0,min_shift + depth * 3
+    while level <= depth:
+        bins.extend(range(first + (beg >> shift),first + (end >> shift) + 1))
+        shift -= 3
+        first += 1 << (level * 3)
+        level += 1
+    return bins
+# **
+
+# ** smallest virtual offset of a record that can overlap a 0-based position **
+# tbi reads the linear index window of the position, csi the loffset of the smallest indexed bin holding the position
+def min_offset(index,ref,beg):
+    if len(index['linear']) > 0:
+        windows = index['linear'][ref]
+        return 0 if len(windows) == 0 else windows[min(beg >> index['min_shift'],len(windows) - 1)]
+    loffsets = index['loffsets'][ref]
+    bin = ((1 << index['depth'] * 3) - 1) // 7 + (beg >> index['min_shift'])
+    while bin > 0 and bin not in loffsets:
+        bin = (bin - 1) >> 3
+    return loffsets.get(bin,0)
+# **
+
+# ** find index next to a bgzipped vcf **
+def find_index(my_vcf):
+    for index_file in [my_vcf + '.tbi',my_vcf + '.csi']:
+        if os.path.exists(index_file):
+            return index_file
+    return None
+# **
+
+# *** yield tokenized records of a bgzipped vcf for one region by seeking to the first overlapping chunk ***
+# chunks ending before the first record that can overlap the region (e.g. large svs in low level bins) are skipped
+def fetch_records(my_vcf,index,chrom,start,end):
+    if chrom not in index['names']:
+        return
+    ref = index['names'].index(chrom)
+    bins = index['refs'][ref]
+    first = min_offset(index,ref,start - 1)
+    chunks = [chunk for bin in reg2bins(start - 1,end,index['min_shift'],index['depth']) for chunk in bins.get(bin,[]) if chunk[1] > first]
+    if len(chunks) == 0:
+        return
+    voffset = max(min([chunk[0] for chunk in chunks]),first)
+
+    # virtual offset is the compressed block offset and the offset within the uncompressed block
+    with open(my_vcf,'rb') as raw:
+        raw.seek(voffset >> 16)
+        with gzip.GzipFile(fileobj = raw) as in1:
+            in1.read(voffset & 0xffff)
+            for fields in iter_records(io.TextIOWrapper(in1)):
+                pos = int(fields[POS])
+                if fields[CHROM] != chrom or pos > end:
+                    break
+                if pos >= start:
+                    yield fields
+# ***
+
+# *** yield records restricted to regions along with breakends whose mates are in the regions ***
+# indexed bgzipped vcfs are read by seeking to each region and to mates outside the regions, otherwise the stream is filtered
+# with an index, breakends outside the regions are found through the ALT of their mate so unpaired breakends are not seen
+def region_records(my_vcf,in1,regions):
+    index_file = find_index(my_vcf)
+    if index_file == None:
+        for fields in iter_records(in1):
+            if keep_record(regions,fields):
+                yield fields
+        return
+
+    index = read_index(index_file)
+    records = dict()
+    for chrom in regions:
+        for start,end in regions[chrom]:
+            for fields in fetch_records(my_vcf,index,chrom,start,end):
+                records['\t'.join(fields)] = fields
+
+    # fetch mates of breakends that fall outside the regions
+    mates = set()
+    for fields in records.values():
+        result = mate_pattern.search(fields[ALT])
+        if result != None and not in_regions(regions,result.group(1),int(result.group(2))):
+            mates.add((result.group(1),int(result.group(2))))
+    for chrom,pos in sorted(mates):
+        for fields in fetch_records(my_vcf,index,chrom,pos,pos):
+            if keep_record(regions,fields):
+                records['\t'.join(fields)] = fields
+
+    # replay in file order
+    rank = {name:idx for idx,name in enumerate(index['names'])}
+    for fields in sorted(records.values(),key = lambda fields: (rank[fields[CHROM]],int(fields[POS]))):
+        yield fields
+# ***
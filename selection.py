@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# identify select matches to deal with multimatching svs
+
+import pandas as pd
+import numpy as np
+from utils import runShards
+
+# *** selectMatches
+# ** deal with multi-matching **
+# create a dictioary of matches for a given id
+# explore matching graph in a greedy manner focusing on events that are most similar and by caller_order and expanding fully connected match graphs
+# outliers that are not fully connected will be considered non-matching with a given clique
+# an edge only looks at the neighbourhood of its svs so connected components of the graph are selected independently -
+# in worker processes when jobs > 1
+
+def select(matches1,ids,out_dir,sample,caller_order,verbose=True,jobs=1):
+
+    outFile1 = out_dir + sample + '-matches2.txt'    
+
+    if verbose:
+        print('selecting best sv matches...', flush=True)            
+
+    # ** identify select matches that represent selection for multi-matching svs **
+    if verbose:
+        print('building sv match graph...', end='',flush=True)            
+    matches1.loc[:,'score'] = matches1[['diff1','diff2']].max(axis=1)  # used to weight matchIDs when multi-matching
+    matches1 = matches1.sort_values(by=['score','matchKey'])  # match keys sort the same as matchIDs
+    # ** greedy matching based on perfect matches and then by matchID **
+
+    # representative cliqueID is by caller order then id - callers not in caller order are never representative
+    rankOf = {caller:rank for rank,caller in enumerate(caller_order)}
+    callerRank = [rankOf.get(caller,len(caller_order)) for caller in ids['caller'].tolist()]
+    # **
+    
+    # ** search for fully connected cliques - components keep score and matchID order within a batch **
+    if verbose:
+        print('identifying cliques...', end='',flush=True)
+    codes1,codes2 = matches1['code'].to_numpy(),matches1['code_b'].to_numpy()
+    batches = componentBatches(codes1,codes2,jobs) if jobs > 1 else [np.arange(len(matches1))]
+    results = runShards(selectEdges,[(codes1[batch],codes2[batch]) for batch in batches],[callerRank,len(caller_order)],jobs)
+
+    # ** combine batches - id strings are looked up for output **
+    idNames = ids['id'].to_numpy()
+    isSelect = np.full(len(matches1),'N',dtype = object)
+    cliqueIDs = np.full(len(matches1),'NA',dtype = object)
+    otherIDs = np.full(len(matches1),'NA',dtype = object)
+    for batch,(selects,cliques,others) in zip(batches,results):
+        for idx,cliqueID,other in zip(batch[selects],cliques,others):
+            isSelect[idx] = 'Y'
+            cliqueIDs[idx] = idNames[cliqueID]
+            otherIDs[idx] = ','.join([idNames[id] for id in other])
+
+    matches1['isSelect'] = isSelect
+    matches1['cliqueID'] = cliqueIDs
+    matches1['other_variant_ids'] = otherIDs
+    # **
+            
+    matches1.to_csv(outFile1,sep="\t",index = False,columns = [column for column in matches1.columns if column not in ['code','code_b','matchKey']])
+    
+    if verbose:
+        print('done')
+    return(matches1)
+# ***
+
+# *** greedy clique selection over edges given in score and matchID order ***
+# returns which edges are selected along with the cliqueID and other id codes of each selected edge
+def selectEdges(codes1,codes2,callerRank,numRanked):
+    # ** build a graph of matches - svs are identified by id code **
+    # partners of an sv are the sv and its matches - the graph does not change so partner sets are built once
+    # selected holds the matches of each sv that were selected as clique edges
+    partners = dict()
+    for id1,id2 in zip(codes1.tolist(),codes2.tolist()):
+        partners.setdefault(id1,{id1}).add(id2)
+        partners.setdefault(id2,{id2}).add(id1)
+    partners = {id:frozenset(ids1) for id,ids1 in partners.items()}
+    selected = {id:set() for id in partners}
+    # **
+
+    selects,cliques,others = np.zeros(len(codes1),dtype = bool),[],[]
+    for idx,(id1,id2) in enumerate(zip(codes1.tolist(),codes2.tolist())):
+        partners1,partners2 = partners[id1],partners[id2]
+        common = sorted(partners1 & partners2)
+
+        # identify representatively cliqueID by caller order
+        cliqueID = min(common,key = lambda id: (callerRank[id],id))
+        assert callerRank[cliqueID] < numRanked
+
+        # look to see if other connected matches are already part of a clique
+        # every partner of id1 or id2 is in the union so any selected match of either counts
+        commonSelect = len((selected[id1] | selected[id2]).intersection(common)) > 0
+        unionSelect = len(selected[id1]) > 0 or len(selected[id2]) > 0
+
+        # scenario 1: isolated clique with all the same partners 
+        # scenario 2: triplicate where not fully connected - common partners are only id1 and id2 and neither is part of a clique then by order we start a clique
+        # scenario 3: new clique and one partner is connected to an extension - common partners are id1,id2, and others
+        # scenario 4: previously identified clique and one partner is connected to an extension - start a clique
+        if partners1 == partners2 or not unionSelect or (len(common) > 2 and commonSelect):
+            selects[idx] = True
+            cliques.append(cliqueID)
+            others.append([id for id in common if id != cliqueID])
+            selected[id1].add(id2)
+            selected[id2].add(id1)
+        # scenario 5: extension of a clique and this edge is not directly in the clique (since common select is not)
+        # prevent false extension
+
+    return(selects,cliques,others)
+# ***
+
+# *** split edges into batches of whole connected components - one batch per job balanced by edge count ***
+# returns edge positions of each batch in their original order
+def componentBatches(codes1,codes2,jobs):
+    # ** label components with union find over id codes **
+    parent = dict()
+    def find(id):
+        root = id
+        while parent.setdefault(root,root) != root:
+            root = parent[root]
+        while parent[id] != root:
+            parent[id],id = root,parent[id]
+        return(root)
+    for id1,id2 in zip(codes1.tolist(),codes2.tolist()):
+        root1,root2 = find(id1),find(id2)
+        if root1 != root2:
+            parent[root2] = root1
+    labels = np.array([find(id) for id in codes1.tolist()],dtype = np.int64)
+    # **
+
+    # ** largest components first to the batch with fewest edges **
+    components,sizes = np.unique(labels,return_counts = True)
+    loads,assigned = [0] * min(jobs,len(components)),dict()
+    for idx in np.argsort(-sizes,kind = 'stable'):
+        batch = loads.index(min(loads))
+        assigned[components[idx]] = batch
+        loads[batch] += sizes[idx]
+    batchOf = np.array([assigned[label] for label in labels.tolist()],dtype = np.int64)
+    return([np.flatnonzero(batchOf == batch) for batch in range(len(loads))])
+    # **
+# ***
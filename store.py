@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# persisted match store of a merged sample - a rerun with an added or replaced vcf only parses, dedups and matches what changed
+# per caller the parsed svs with their dup flags are kept along with the matches of each caller pair
+# callers are keyed by the parse cache keys of their vcfs so a caller is reused only when all of its vcfs are unchanged
+# keys are computed once per run by the pipeline and shared with the parse cache
+
+import pandas as pd
+import numpy as np
+import os,json,hashlib
+from reader import open_vcf,read_header
+from parse import detect_caller
+from cache import table_format
+
+# bump when stored tables change so stale stores are never loaded
+store_version = 1
+
+# columns of stored caller pair matches - ids replace the id codes of a run
+storeColumns = ['id','chrom1','pos1','chrom2','pos2','id_b','chrom1_b','pos1_b','chrom2_b','pos2_b','diff1','diff2','ro']
+
+# *** caller of each vcf and parse cache keys of each caller ***
+# callers of vcfs already in the store come from store.json - only new or replaced vcfs are opened for their header
+def caller_keys(vcf_list,vcf_keys,store_dir):
+    stored = dict()
+    if os.path.exists(store_dir + 'store.json'):
+        with open(store_dir + 'store.json') as in1:
+            stored = {key:caller for caller,caller_keys in json.load(in1)['callers'].items() for key in caller_keys}
+
+    callers,keys = [],dict()
+    for my_vcf,key in zip(vcf_list,vcf_keys):
+        if key not in stored:
+            with open_vcf(my_vcf) as in1:
+                stored[key] = detect_caller(read_header(in1))
+        callers.append(stored[key])
+        keys.setdefault(callers[-1],[]).append(key)
+    return callers,{caller:sorted(caller_keys) for caller,caller_keys in keys.items()}
+# ***
+
+# ** table file name for a caller or caller pair and the keys it was built from **
+def table_name(label,keys):
+    return label + '-' + hashlib.sha1(json.dumps(keys).encode()).hexdigest()[:12]
+# **
+
+# ** read and write a stored table **
+def read_table(store_dir,name,fmt):
+    if fmt == 'parquet':
+        return pd.read_parquet(store_dir + name + '.parquet')
+    return pd.read_pickle(store_dir + name + '.pkl')
+
+def write_table(df,store_dir,name,fmt):
+    if fmt == 'parquet':
+        df.to_parquet(store_dir + name + '.parquet',index = False)
+    else:
+        df.to_pickle(store_dir + name + '.pkl')
+# **
+
+# *** load svs of callers with unchanged vcfs and the matches between them ***
+# returns caller -> svs (with isDup) and (caller,caller_b) -> matches - empty when there is no usable store
+def load_store(store_dir,keys,slack,recipOverlap):
+    if not os.path.exists(store_dir + 'store.json'):
+        return dict(),dict()
+    with open(store_dir + 'store.json') as in1:
+        store = json.load(in1)
+    if store['version'] != store_version or store['slack'] != slack or store['recipOverlap'] != recipOverlap:
+        return dict(),dict()
+
+    reused = [caller for caller in store['callers'] if keys.get(caller) == store['callers'][caller]]
+    svs = {caller:read_table(store_dir,table_name(caller,keys[caller]),store['format']) for caller in reused}
+    matches = dict()
+    for caller,caller_b in store['pairs']:
+        if caller in reused and caller_b in reused:
+            dfMatch = read_table(store_dir,table_name(caller + '__' + caller_b,keys[caller] + keys[caller_b]),store['format'])
+            dfMatch['ro'] = np.where(dfMatch['chrom1'] == dfMatch['chrom2'],dfMatch['ro'].astype(object),'NA')  # interchrom matches have no ro
+            matches[(caller,caller_b)] = dfMatch
+    return svs,matches
+# ***
+
+# *** store svs of every caller and matches of every caller pair of this run ***
+# tables are named by the keys they were built from and store.json is replaced last so a store is never half written
+def save_store(store_dir,keys,df_all,ids,matches,callerPairs,slack,recipOverlap):
+    os.makedirs(store_dir,exist_ok = True)
+    fmt = table_format()
+    names = []
+    for caller,df in df_all.groupby('caller',observed = True,sort = True):
+        names.append(table_name(caller,keys[caller]))
+        write_table(df.reset_index(drop = True),store_dir,names[-1],fmt)
+
+    if len(callerPairs) > 0:
+        matchCallers = ids['caller'].to_numpy()[matches['code'].to_numpy()],ids['caller'].to_numpy()[matches['code_b'].to_numpy()]
+        dfStore = matches.assign(id = ids['id'].to_numpy()[matches['code'].to_numpy()],id_b = ids['id'].to_numpy()[matches['code_b'].to_numpy()])[storeColumns]
+        dfStore['ro'] = pd.to_numeric(dfStore['ro'],errors = 'coerce')
+        for caller,caller_b in callerPairs:
+            names.append(table_name(caller + '__' + caller_b,keys[caller] + keys[caller_b]))
+            write_table(dfStore[(matchCallers[0] == caller) & (matchCallers[1] == caller_b)].reset_index(drop = True),store_dir,names[-1],fmt)
+
+    with open(store_dir + 'store.json.tmp','w') as out1:
+        json.dump({'version':store_version,'slack':slack,'recipOverlap':recipOverlap,'format':fmt,'callers':keys,'pairs':callerPairs},out1)
+    os.replace(store_dir + 'store.json.tmp',store_dir + 'store.json')
+
+    # remove tables of replaced callers
+    for file in os.listdir(store_dir):
+        if file != 'store.json' and file.rsplit('.',1)[0] not in names:
+            os.remove(store_dir + file)
+# ***
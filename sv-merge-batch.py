@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# cohort batch mode - runs sv-merge for every sample in a manifest from one interpreter
+# samples run in forked worker processes so pandas is imported once, memory is returned when a sample
+# finishes and a failing sample does not stop the rest
+
+import argparse,os,sys,time,traceback,resource
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import pandas as pd
+from reader import read_regions
+from pipeline import run_sample
+
+parser = argparse.ArgumentParser(prog='sv-merge-batch.py', description='Runs sv-merge for each sample in a manifest with a pool of worker processes.', epilog='manifest is tab-delimited: sample, vcfs separated by a comma with no spaces, optional outdir')
+parser.add_argument('-m','--manifest', help = 'Tab-delimited manifest with one sample per line: sample, vcfs separated by a comma, optional outdir.  Lines starting with # and a header line starting with sample are skipped', required = True, dest = 'manifest')
+parser.add_argument('-o','--outdir', help = 'Path to destination directory.  Samples without an outdir in the manifest are written to outdir/sample/ and the batch summary is written here', required = True, dest = 'outdir')
+parser.add_argument('-w','--workers', help = 'Number of samples run at the same time.  Default is 1', required = False, dest = 'workers', type = int, default = '1')
+parser.add_argument('--memory-gb', help = 'Memory budget in GB shared by running samples.  Samples are started only while their estimated memory fits in the budget (a sample larger than the budget runs alone).  Default is 80 percent of physical memory', required = False, dest = 'memory_gb', type = float)
+parser.add_argument('--memory-factor', help = 'Estimated peak memory of a sample as a multiple of its uncompressed vcf size.  Default is 25', required = False, dest = 'memory_factor', type = float, default = '25')
+parser.add_argument('--slack', help = 'Allowance in bps for imperfect variant position comparisons.  Default is 200', required = False, dest = 'slack', type = int, default = '200')
+parser.add_argument('-ro','--reciprical-overlap', help = 'Proportion of overlap required for 2 intrachromosomal svs to match that is defined by the intersection divided by the larger sv length.  Default is 0 or none', required = False, dest = 'ro', type = float, default = '0')
+parser.add_argument('--verbose', help = 'T or F for screen output of sample progress.  Per sample output is written to outdir/sample-batch.log.  Default is T for true', required = False, dest = 'verbose', default = 'T')
+parser.add_argument('--caller-order', help = 'Order of variant callers to show call details when calls match. example: svaba,manta,gridss', required = False, dest = 'caller_order', default = 'svaba,manta,gridss')
+parser.add_argument('-j','--jobs', help = 'Number of worker processes used within each sample to parse vcfs and match calls by chromosome.  Default is 1', required = False, dest = 'jobs', type = int, default = '1')
+parser.add_argument('--write-caller-tables', help = 'T or F to write the per caller .txt tables.  Default is T for true', required = False, dest = 'write_tables', default = 'T')
+parser.add_argument('--regions', help = 'Restrict parsing to regions given as a bed file or chr:start-end list separated by a comma with no spaces.  Applied to every sample.  Default is all records', required = False, dest = 'regions')
+parser.add_argument('--cache-dir', help = 'Directory to cache parsed caller tables shared by all samples.  Default is no cache', required = False, dest = 'cache_dir')
+parser.add_argument('--cache-size', help = 'Maximum size of the parse cache in GB.  Default is 5', required = False, dest = 'cache_size', type = float, default = '5')
+parser.add_argument('--match-store', help = 'T or F to keep a match store per sample so reruns with added or replaced vcfs only process the changed callers.  Default is F', required = False, dest = 'match_store', default = 'F')
+parser.add_argument('--vcf-index', help = 'F to write sample-sv-merge.vcf in table order.  tbi or csi to write a coordinate sorted and bgzipped sample-sv-merge.vcf.gz with ##contig headers and a .tbi or .csi index.  Default is F', required = False, dest = 'vcf_index', default = 'F', choices = ['F','tbi','csi'])
+args = parser.parse_args()
+
+out_dir = args.outdir if args.outdir[-1] == '/' else args.outdir + '/'
+workers = max(args.workers,1)
+memory_bytes = int(args.memory_gb * 2**30) if args.memory_gb != None else int(0.8 * os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'))
+verbose = True if args.verbose == 'T' else False
+options = {'slack':args.slack,'recipOverlap':float(args.ro),'caller_order':args.caller_order.split(','),'jobs':args.jobs,
+           'write_tables':True if args.write_tables == 'T' else False,'regions':read_regions(args.regions) if args.regions else None,
+           'cache_dir':None if args.cache_dir == None else args.cache_dir if args.cache_dir[-1] == '/' else args.cache_dir + '/',
+           'cache_bytes':int(args.cache_size * 2**30),'match_store':True if args.match_store == 'T' else False,'vcf_index':args.vcf_index}
+
+if not os.path.exists(out_dir):
+    os.makedirs(out_dir)
+
+# *** read manifest to a list of samples ***
+def read_manifest(manifest):
+    samples = []
+    with open(manifest) as in1:
+        for line in in1:
+            if line.strip() == '' or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if fields[0] == 'sample' and len(samples) == 0:
+                continue
+            if len(fields) < 2:
+                raise Exception('i no understand manifest line: ' + line.rstrip('\n'))
+            sample,vcfs = fields[0],fields[1]
+            sample_dir = fields[2] if len(fields) > 2 and fields[2] != '' else out_dir + sample
+            sample_dir = sample_dir if sample_dir[-1] == '/' else sample_dir + '/'
+            samples.append({'sample':sample,'vcfs':vcfs.split(','),'outdir':sample_dir})
+
+    names = [record['sample'] for record in samples]
+    dups = sorted(set([name for name in names if names.count(name) > 1]))
+    if len(dups) > 0:
+        raise Exception('duplicate samples in manifest: ' + ','.join(dups))
+    return samples
+# ***
+
+# ** estimated peak memory of a sample from the size of its vcfs - compressed vcfs are assumed to expand 5x **
+def estimate_memory(vcf_list):
+    total = 0
+    for my_vcf in vcf_list:
+        if not os.path.exists(my_vcf):
+            continue
+        with open(my_vcf,'rb') as in1:
+            compressed = in1.read(2) == b'\x1f\x8b'
+        total += os.path.getsize(my_vcf) * (5 if compressed else 1)
+    return int(total * args.memory_factor)
+# **
+
+# *** run one sample in a worker process and report status back through a pipe ***
+def run_worker(conn,record):
+    status,message = 'done',''
+    try:
+        if not os.path.exists(record['outdir']):
+            os.makedirs(record['outdir'])
+        log = open(record['outdir'] + record['sample'] + '-batch.log','w')
+        sys.stdout = sys.stderr = log
+        run_sample(record['vcfs'],record['outdir'],record['sample'],options['slack'],options['recipOverlap'],True,options['caller_order'],
+                   -1,False,options['jobs'],options['write_tables'],options['regions'],options['cache_dir'],options['cache_bytes'],options['match_store'],options['vcf_index'])
+    except BaseException as error:
+        status,message = 'failed',type(error).__name__ + ': ' + str(error).replace('\t',' ').replace('\n',' ')
+        traceback.print_exc()
+    sys.stdout.flush()
+    # parse and match workers of a sample run with jobs > 1 are children of this process
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+    conn.send((status,message,peak))
+    conn.close()
+# ***
+
+# *** schedule samples largest first while the worker count and memory budget allow ***
+def run_batch(samples):
+    for record in samples:
+        record['estimate'] = estimate_memory(record['vcfs'])
+    pending = sorted(samples,key = lambda record: -record['estimate'])
+    running = dict()
+    results = dict()
+    context = mp.get_context('fork')
+
+    while len(pending) > 0 or len(running) > 0:
+        # start samples - the next sample waits for memory to be freed unless nothing else is running
+        used = sum([record['estimate'] for proc,conn,record,start in running.values()])
+        while len(pending) > 0 and len(running) < workers and (len(running) == 0 or used + pending[0]['estimate'] <= memory_bytes):
+            record = pending.pop(0)
+            conn,child_conn = context.Pipe(duplex = False)
+            proc = context.Process(target = run_worker,args = (child_conn,record))
+            proc.start()
+            child_conn.close()
+            running[proc.sentinel] = (proc,conn,record,time.time())
+            used += record['estimate']
+
+        # collect finished samples
+        for sentinel in wait(list(running.keys())):
+            proc,conn,record,start = running.pop(sentinel)
+            proc.join()
+            if conn.poll():
+                status,message,peak = conn.recv()
+            else:  # worker was killed (e.g. out of memory) before reporting
+                status,message,peak = 'failed','worker exited with code ' + str(proc.exitcode),None
+            conn.close()
+            results[record['sample']] = {'status':status,'seconds':round(time.time() - start,2),'peak_mem_gb':None if peak == None else round(peak / 2**30,3),
+                                         'estimated_mem_gb':round(record['estimate'] / 2**30,3),'outdir':record['outdir'],'message':message}
+            if verbose:
+                print(record['sample'] + ' ' + status + ' in ' + str(results[record['sample']]['seconds']) + 's (' + str(len(results)) + '/' + str(len(samples)) + ')',flush=True)
+    return results
+# ***
+
+def main():
+    samples = read_manifest(args.manifest)
+    if verbose:
+        print('running ' + str(len(samples)) + ' samples with ' + str(workers) + ' workers and ' + str(round(memory_bytes / 2**30,1)) + 'GB memory budget',flush=True)
+
+    start = time.time()
+    results = run_batch(samples)
+
+    # summary in manifest order
+    dfSummary = pd.DataFrame([dict(sample = record['sample'],**results[record['sample']]) for record in samples],
+                             columns = ['sample','status','seconds','peak_mem_gb','estimated_mem_gb','outdir','message'])
+    dfSummary.to_csv(out_dir + 'batch-summary.txt',sep='\t',index=False,na_rep='NA')
+
+    failed = (dfSummary['status'] != 'done').sum()
+    if verbose:
+        print(str(len(samples) - failed) + ' samples done, ' + str(failed) + ' failed in ' + str(round(time.time() - start,2)) + 's',flush=True)
+        print('summary written to ' + out_dir + 'batch-summary.txt',flush=True)
+    if failed > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,8 @@
 # 20231003 arb
 
 import argparse,os
-import pandas as pd
-import parse as p
-from parse import parse_vcfs
-from compare import compare
-from merge import merge
-from dedup import dedup
-from select import select
+from reader import read_regions
+from pipeline import run_sample
 
 parser = argparse.ArgumentParser(prog='sv-merge.py', description='Combines structural variant (SV) calls from multiple caller vcfs for a given sample.', epilog='manta and svaba currently supported')
 parser.add_argument('-v','--vcfs', help = 'Vcf file names separated by a comma with no spaces.  2 vcfs required for comparison. If 1 vcf is provided it will be parsed.', required = True, dest = 'vcfs')
@@ -18,6 +13,14 @@ parser.add_argument('--slack', help = 'Allowance in bps for imperfect variant po
 parser.add_argument('-ro','--reciprical-overlap', help = 'Proportion of overlap required for 2 intrachromosomal svs to match that is defined by the intersection divided by the larger sv length.  Default is 0 or none', required = False, dest = 'ro', type = float, default = '0')
 parser.add_argument('--verbose', help = 'T or F for screen output.  Default is T for true', required = False, dest = 'verbose', default = 'T')
 parser.add_argument('--caller-order', help = 'Order of variant callers to show call details when calls match. example: svaba,manta,gridss', required = False, dest = 'caller_order', default = 'svaba,manta,gridss')
+parser.add_argument('--check-parity', help = 'T or F to confirm the built-in vcf reader decodes the same values as PyVCF before parsing (requires PyVCF).  Default is F', required = False, dest = 'check_parity', default = 'F')
+parser.add_argument('-j','--jobs', help = 'Number of worker processes used to parse the input vcfs and to match calls by chromosome in parallel.  Default is 1', required = False, dest = 'jobs', type = int, default = '1')
+parser.add_argument('--write-caller-tables', help = 'T or F to write the per caller .txt tables.  Default is T for true', required = False, dest = 'write_tables', default = 'T')
+parser.add_argument('--regions', help = 'Restrict parsing to regions given as a bed file or chr:start-end list separated by a comma with no spaces.  Breakends with a mate in the regions are kept.  Indexed (.tbi/.csi) bgzipped vcfs are read by seeking to the regions.  Default is all records', required = False, dest = 'regions')
+parser.add_argument('--cache-dir', help = 'Directory to cache parsed caller tables so reruns with the same vcfs skip parsing (e.g. when tuning --slack).  Default is no cache', required = False, dest = 'cache_dir')
+parser.add_argument('--cache-size', help = 'Maximum size of the parse cache in GB.  Least recently used entries are removed beyond this.  Default is 5', required = False, dest = 'cache_size', type = float, default = '5')
+parser.add_argument('--match-store', help = 'T or F to keep parsed calls, dups and caller pair matches in outdir/sample-store/ so a rerun with an added or replaced vcf only parses, dedups and compares the changed callers.  Default is F', required = False, dest = 'match_store', default = 'F')
+parser.add_argument('--vcf-index', help = 'F to write sample-sv-merge.vcf in table order.  tbi or csi to write a coordinate sorted and bgzipped sample-sv-merge.vcf.gz with ##contig headers and a .tbi or .csi index.  Default is F', required = False, dest = 'vcf_index', default = 'F', choices = ['F','tbi','csi'])
 parser.add_argument('-n','--number-svs', help = 'debug param for selected the first N SVs from each vcf. default is -1 to turn off and process all SVs. example: 100', required = False, dest = 'num', default = '-1')
 args = parser.parse_args()
 
@@ -29,32 +32,20 @@ verbose = True if args.verbose == 'T' else False
 caller_order = args.caller_order.split(',')
 numSVs = int(args.num)
 recipOverlap = float(args.ro)
+check_parity = True if args.check_parity == 'T' else False
+jobs = args.jobs
+write_tables = True if args.write_tables == 'T' else False
+regions = read_regions(args.regions) if args.regions else None
+cache_dir = None if args.cache_dir == None else args.cache_dir if args.cache_dir[-1] == '/' else args.cache_dir + '/'
+cache_bytes = int(args.cache_size * 2**30)
+match_store = True if args.match_store == 'T' else False
+vcf_index = args.vcf_index
 
 if not os.path.exists(out_dir):
     os.makedirs(out_dir)
 
 def main():
-    # parse vcfs
-    vcf_list = sorted(vcfs.split(','))
+    run_sample(vcfs.split(','),out_dir,sample,slack,recipOverlap,verbose,caller_order,numSVs,check_parity,jobs,write_tables,regions,cache_dir,cache_bytes,match_store,vcf_index)
 
-    df_all = parse_vcfs(vcf_list,out_dir,sample,numSVs,verbose)
-
-    # mark duplicate calls 
-    df_all = dedup(df_all,out_dir,sample,slack,recipOverlap,verbose)
-
-#    df_all = pd.read_csv('intermediate/02/results/LNCaP_APIPC-svs.txt',sep="\t")  # for testing
-
-    if len(vcf_list) > 1:  # only possible to compare more than 1 vcf
-        # compare calls
-        dfMatches1 = compare(df_all,out_dir,sample,caller_order,slack,recipOverlap,verbose)
-
-        # select matches to merge on (deal with multimatching)
-#        dfMatches1 = pd.read_csv('intermediate/02/results/LNCaP_APIPC-matches1.txt',sep="\t")   # for testing
-        dfMatches2 = select(dfMatches1,out_dir,sample,caller_order,verbose)
-
-        # merge calls to be
-#        dfMatches2 = pd.read_csv('intermediate/02/results/LNCaP_APIPC-matches2.txt',sep="\t")   # for testing
-        merge(df_all,dfMatches2,out_dir,sample,verbose,caller_order)
-    
 if __name__ == '__main__':
     main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# merge regression - a cliqueID without a select match of its own is written as a non-matching call
+
+import os,sys
+import pandas as pd
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from merge import merge
+
+# ** one sv per caller and event **
+def make_svs(events):
+    rows = []
+    for caller,event,pos in events:
+        rows.append({'sample':'S','caller':caller,'event_id':event,'variant_id':event + ':1','chrom':'chr1','pos':pos,'ref':'N','alt':'N]chr1:' + str(pos + 1000) + ']',
+                     'mate_id':event + ':2','tumor_discordant_rs':3,'tumor_spanning_rs':5,'tumor_dp':20,'intra_chrom_event_length':1000,
+                     'id':'S__' + caller + '__' + event,'isDup':'N'})
+    return pd.DataFrame(rows)
+# **
+
+def test_cliqueID_without_select_match(tmp_path):
+    df_all = make_svs([('svaba','e1',100),('manta','e2',110),('gridss','e3',120),('svaba','e4',5000),('manta','e5',5010)])
+    ids = df_all[['id','sample','caller','event_id']].sort_values(by = 'id').reset_index(drop = True)
+
+    # svaba e1 represents the manta e2 - gridss e3 clique but is not an end of its select match
+    df_comp = pd.DataFrame({'id':['S__manta__e2','S__svaba__e4'],'id_b':['S__gridss__e3','S__manta__e5'],'isSelect':['Y','Y'],
+                            'cliqueID':['S__svaba__e1','S__svaba__e4'],'other_variant_ids':['S__gridss__e3,S__manta__e2','S__manta__e5']})
+
+    merge(df_all,ids,df_comp,str(tmp_path) + '/','S',False)
+    dfMerge = pd.read_csv(str(tmp_path) + '/S-sv-merge.txt',sep = '\t',keep_default_na = False).set_index('event_id')
+
+    # clique members that are not the cliqueID are not written
+    assert sorted(dfMerge.index) == ['e1','e4']
+    assert dfMerge.loc['e1',['is_matching','callers','num_callers','other_variant_ids']].tolist() == ['N','svaba',1,'NA']
+    assert dfMerge.loc['e4',['is_matching','callers','num_callers','other_variant_ids']].tolist() == ['Y','manta;svaba',2,'manta__e5']
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# pipeline regressions - callers without calls or without a shared chromosome still give a merged table
+
+import os,sys
+import pandas as pd
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import run_sample
+from reader import read_regions
+
+info_header = ['##INFO=<ID=SVTYPE,Number=1,Type=String,Description="Type of structural variant">',
+               '##INFO=<ID=SVLEN,Number=.,Type=Integer,Description="Difference in length between REF and ALT alleles">',
+               '##INFO=<ID=END,Number=1,Type=Integer,Description="End position of the variant">',
+               '##INFO=<ID=MATEID,Number=.,Type=String,Description="ID of mate breakends">',
+               '##INFO=<ID=EVENT,Number=1,Type=String,Description="ID of event associated to breakend">']
+manta_header = ['##fileformat=VCFv4.1','##source=GenerateSVCandidates 1.6.0','##cmdline=/opt/manta/bin/configManta.py'] + info_header + [
+                '##FORMAT=<ID=PR,Number=.,Type=Integer,Description="Spanning paired-read support">',
+                '##FORMAT=<ID=SR,Number=.,Type=Integer,Description="Split reads">',
+                '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tNORMAL\tTUMOR']
+gridss_header = ['##fileformat=VCFv4.2','##source=gridss'] + info_header + [
+                 '##FORMAT=<ID=SR,Number=1,Type=Integer,Description="Split reads">',
+                 '##FORMAT=<ID=VF,Number=1,Type=Integer,Description="Fragments supporting the breakpoint">',
+                 '##FORMAT=<ID=REF,Number=1,Type=Integer,Description="Reads across the breakend">',
+                 '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tnormal\ttumor']
+
+# manta deletion on chr1 and gridss breakend pair on chr2
+manta_del = 'chr1\t10000\tMantaDEL:1:0:1:0:0:0\tT\t<DEL>\t.\t{}\tSVTYPE=DEL;SVLEN=-2000;END=12000\tPR:SR\t40,1:12,0\t34,13:44,20'
+gridss_bnd = ['chr2\t5000\tgridss1_1o\tG\tG[chr2:9000[\t300\tPASS\tEVENT=gridss1_1;MATEID=gridss1_1h;SVTYPE=BND\tSR:VF:REF\t0:0:47\t10:8:52',
+              'chr2\t9000\tgridss1_1h\tA\t]chr2:5000]A\t300\tPASS\tEVENT=gridss1_1;MATEID=gridss1_1o;SVTYPE=BND\tSR:VF:REF\t0:0:47\t10:8:52']
+
+# ** write a vcf and return its path **
+def write_vcf(tmp_path,name,lines):
+    my_vcf = str(tmp_path) + '/' + name
+    with open(my_vcf,'w') as out1:
+        out1.write(''.join([line + '\n' for line in lines]))
+    return my_vcf
+# **
+
+def run_merge(tmp_path,manta_filter,regions = None,caller_order = ['svaba','manta','gridss'],verbose = False):
+    vcf_list = [write_vcf(tmp_path,'S.manta.vcf',manta_header + [manta_del.format(manta_filter)]),write_vcf(tmp_path,'S.gridss.vcf',gridss_header + gridss_bnd)]
+    out_dir = str(tmp_path) + '/out/'
+    os.makedirs(out_dir)
+    run_sample(vcf_list,out_dir,'S',200,0.8,verbose,caller_order,regions = regions)
+    return pd.read_csv(out_dir + 'S-sv-merge.txt',sep = '\t',keep_default_na = False)
+
+# both break points of each call are written
+def test_caller_without_calls(tmp_path):
+    dfMerge = run_merge(tmp_path,'MinQUAL')
+    assert dfMerge['variant_id'].tolist() == ['gridss1_1h','gridss1_1o']
+    assert set(dfMerge['is_matching']) == {'N'}
+
+def test_region_without_calls_of_a_caller(tmp_path):
+    dfMerge = run_merge(tmp_path,'PASS',read_regions('chr2:1-20000'))
+    assert dfMerge['variant_id'].tolist() == ['gridss1_1h','gridss1_1o']
+
+def test_callers_without_shared_chromosome(tmp_path):
+    dfMerge = run_merge(tmp_path,'PASS')
+    assert sorted(set(dfMerge['callers'])) == ['gridss','manta']
+    assert set(dfMerge['is_matching']) == {'N'}
+
+# callers missing from caller order are matched after the callers in it
+def test_caller_order_of_other_callers(tmp_path):
+    dfMerge = run_merge(tmp_path,'PASS',caller_order = ['manta','delly'],verbose = True)
+    assert sorted(set(dfMerge['callers'])) == ['gridss','manta']
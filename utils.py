@@ -3,61 +3,184 @@
 # note: pyranges is 0's based coords
 
 import pandas as pd
+import numpy as np
+import re
+from concurrent.futures import ThreadPoolExecutor,ProcessPoolExecutor
+
+# ** intermediate tables are written by a background thread while later stages run **
+writer = ThreadPoolExecutor(max_workers = 1)
+pending_writes = []
+
+def write_table(df,outFile):
+    pending_writes.append(writer.submit(df.to_csv,outFile,sep="\t",index = False))
+
+# wait for background writes to finish - raises any write errors
+def wait_for_writes():
+    while len(pending_writes) > 0:
+        pending_writes.pop(0).result()
+# **
+
+# ** rank chromosomes by name without the chr prefix - precomputed once per table instead of compared per pair **
+# names are ranked as strings so chr10 sorts before chr2, as they always have
+def chromRanks(chroms):
+    stripped = {chrom:chrom.replace('chr','') for chrom in chroms}
+    order = {value:rank for rank,value in enumerate(sorted(set(stripped.values())))}
+    return {chrom:order[value] for chrom,value in stripped.items()}
+# **
 
 def convertPaired(df1,verbose = True):
     if verbose:
         print('converting to paired BEs...',end='',flush = True)
 
-    # ** create a data frame with both break points **
-    id2vars = {}
-    df2 = []
-    for idx,row in df1.iterrows():
-        lineDict = row.to_dict()
-
-        # keep track
-        id,variant_id = lineDict['id'],lineDict['variant_id']
-        chrom,pos,dp,spanning = lineDict['chrom'],lineDict['pos'],lineDict['tumor_dp'],lineDict['tumor_spanning_rs']
-        variantDict = {'variant_id':variant_id,'chrom':chrom,'pos':pos,'dp':dp,'spanning':spanning}
-        sample,caller = lineDict['sample'],lineDict['caller']
-
-        # add to lookup table
-        if id not in id2vars:
-            id2vars[id] = {}
-            id2vars[id][variant_id] = variantDict
-        # if see before then add to df 
-        else:
-            id2vars[id][variant_id] = variantDict
-            variants = list(id2vars[id].keys())
-            assert len(variants) == 2
-
-            # first we order by variant id
-            if variants[0] < variants[1]:
-                variant1,variant2 = variants
-            else:
-                variant2,variant1 = variants
-
-            # ** first we confirm that interchrom breakend order is correct by looking at chroms **
-            chrom1,chrom2 = id2vars[id][variant1]['chrom'],id2vars[id][variant2]['chrom']
-            if chrom1 != chrom2:
-                # if interchrom sv then we order by chrom#
-                chromVal1,chromVal2 = chrom1.replace('chr',''),chrom2.replace('chr','')
-
-                # numeric chroms
-                if isinstance(chromVal1,int) and isinstance(chromVal2,int):
-                    chromVal1,chromVal2 = int(chromVal1),int(chromVal2)
-                    if chromVal2 < chromVal1:
-                        variant2,variant1 = variants
-                else:
-                    if chromVal2 < chromVal1:
-                        variant2,variant1 = variants
-                chrom1,chrom2 = id2vars[id][variant1]['chrom'],id2vars[id][variant2]['chrom']
-            # **
-            
-            pos1,pos2 = id2vars[id][variant1]['pos'],id2vars[id][variant2]['pos']
-            dp1,dp2 = id2vars[id][variant1]['dp'],id2vars[id][variant2]['dp']
-            spanning1,spanning2 = id2vars[id][variant1]['spanning'],id2vars[id][variant2]['spanning']                        
-            row = {'sample':sample,'caller':caller,'id':id,'chrom1':chrom1,'pos1':pos1,'dp1':dp1,'chrom2':chrom2,'pos2':pos2,'dp2':dp2,'spanning1':spanning1,'spanning2':spanning2}
-            df2.append(row)
-    df2 = pd.DataFrame(df2)
+    # ** split break points by id - pairs are completed at the second break point of each id in table order **
+    occurrence = df1.groupby('id',sort = False,observed = True).cumcount().to_numpy()
+    assert (occurrence < 2).all()
+    second = df1[occurrence == 1]
+    first = df1[occurrence == 0].set_index('id').loc[second['id']]
+    assert (first['variant_id'].to_numpy() != second['variant_id'].to_numpy()).all()
+    # **
+
+    # ** first we order by variant id **
+    firstIs1 = first['variant_id'].to_numpy() < second['variant_id'].to_numpy()
+    chromA = np.where(firstIs1,first['chrom'].to_numpy(),second['chrom'].to_numpy())
+    chromB = np.where(firstIs1,second['chrom'].to_numpy(),first['chrom'].to_numpy())
+
+    # ** interchrom svs are ordered by chrom rank - break points then follow the order they were seen **
+    ranks = chromRanks(set(chromA) | set(chromB))
+    rankA,rankB = np.array([ranks[chrom] for chrom in chromA]),np.array([ranks[chrom] for chrom in chromB])
+    firstIs1 = np.where((chromA != chromB) & (rankB < rankA),False,firstIs1)
+    # **
+
+    df2 = pd.DataFrame({'sample':second['sample'].to_numpy(),'caller':second['caller'].to_numpy(),'id':second['id'].to_numpy()})
+    for column,label in [('chrom','chrom'),('pos','pos'),('tumor_dp','dp')]:
+        df2[label + '1'] = np.where(firstIs1,first[column].to_numpy(),second[column].to_numpy())
+        df2[label + '2'] = np.where(firstIs1,second[column].to_numpy(),first[column].to_numpy())
+    df2['spanning1'] = np.where(firstIs1,first['tumor_spanning_rs'].to_numpy(),second['tumor_spanning_rs'].to_numpy())
+    df2['spanning2'] = np.where(firstIs1,second['tumor_spanning_rs'].to_numpy(),first['tumor_spanning_rs'].to_numpy())
+    df2 = df2[['sample','caller','id','chrom1','pos1','dp1','chrom2','pos2','dp2','spanning1','spanning2']]
+    return(df2)
+# **
+
+# ** run-wide id dictionary - each sv id gets a dense integer code with its sample and caller alongside **
+# codes follow sorted id order so sorting codes sorts ids - matchRank orders ids the way they sort at the front of a '___' joined match id
+def internIDs(df_all):
+    ids = df_all[['id','sample','caller','event_id']].drop_duplicates('id').sort_values(by='id').reset_index(drop = True)
+    ids['matchRank'] = (ids['id'] + '___').rank(method = 'first').astype(np.int64).to_numpy() - 1
+    return(ids)
+# **
+
+# ** numeric key for a pair of id codes - sorts the same as the '___' joined id strings **
+def matchKeys(ids,codes1,codes2):
+    low,high = np.minimum(codes1,codes2),np.maximum(codes1,codes2)
+    return((ids['matchRank'].to_numpy()[low] << 32) | high)
+# **
+
+# ** rebuild '___' joined match id strings for output **
+def matchIDs(ids,codes1,codes2):
+    low,high = np.minimum(codes1,codes2),np.maximum(codes1,codes2)
+    names = ids['id'].to_numpy()
+    return(names[low] + '___' + names[high])
+# **
+
+# ** paired break points for every event - built once after parsing and shared by dedup and compare **
+# pairs keep table order so subsets by caller are the same as pairing each subset on its own
+# events are identified by id code - id strings are looked up in the id dictionary when writing output
+def pairEvents(df_all,ids,verbose = True):
+    pairs = convertPaired(df_all,verbose)
+    insIDs = df_all.loc[df_all['variant_id'].str.contains('INS'),'id']
+    pairs['isIns'] = pairs['id'].isin(insIDs)
+    pairs.insert(0,'code',pd.Index(ids['id']).get_indexer(pairs['id']).astype(np.int64))
+    pairs = pairs.drop(columns = ['sample','caller','id'])
+    if verbose:
+        print('done')
+    return(pairs)
+# **
+
+# ** put interchrom break points in chrom rank order - how pairs come out of convertPaired for variant id sorted tables **
+def orderByChrom(df2):
+    df2 = df2.copy()
+    ranks = chromRanks(set(df2['chrom1']) | set(df2['chrom2']))
+    swap = ((df2['chrom1'] != df2['chrom2']) & (df2['chrom2'].map(ranks) < df2['chrom1'].map(ranks))).to_numpy()
+    for label in ['chrom','pos','dp','spanning']:
+        value1,value2 = df2[label + '1'].to_numpy(),df2[label + '2'].to_numpy()
+        df2[label + '1'],df2[label + '2'] = np.where(swap,value2,value1),np.where(swap,value1,value2)
     return(df2)
 # **
+
+# ** match paired BEs on both break points in one query **
+# pairs are bucketed by (chrom1,chrom2,pos1 bin,pos2 bin) with bins slack + 1 wide so pairs within slack on both
+# break points fall in the same or neighbouring buckets - only those 9 buckets are probed
+# returns rows of df1 joined to matching rows of df2 (columns suffixed with _b) like a pyranges join
+def matchBreakends(df1,df2,slack=200):
+    width = slack + 1
+    keys = ['chrom1','chrom2','bin1','bin2']
+    pos1,pos2 = df1['pos1'].to_numpy(dtype = np.int64),df1['pos2'].to_numpy(dtype = np.int64)
+    pos1_b,pos2_b = df2['pos1'].to_numpy(dtype = np.int64),df2['pos2'].to_numpy(dtype = np.int64)
+    index1 = pd.DataFrame({'chrom1':df1['chrom1'].to_numpy(),'chrom2':df1['chrom2'].to_numpy(),'bin1':pos1 // width,'bin2':pos2 // width,'row':np.arange(len(df1))})
+    index2 = pd.DataFrame({'chrom1':df2['chrom1'].to_numpy(),'chrom2':df2['chrom2'].to_numpy(),'bin1':pos1_b // width,'bin2':pos2_b // width,'row_b':np.arange(len(df2))})
+
+    # each candidate pair is found by exactly one bucket offset
+    candidates = []
+    for shift1 in [-1,0,1]:
+        for shift2 in [-1,0,1]:
+            probe = index1.copy()
+            probe['bin1'] += shift1
+            probe['bin2'] += shift2
+            candidates.append(probe.merge(index2,on = keys)[['row','row_b']])
+    candidates = pd.concat(candidates,axis=0,ignore_index = True)
+    rows,rows_b = candidates['row'].to_numpy(),candidates['row_b'].to_numpy()
+    order = np.argsort(rows.astype(np.int64) * len(df2) + rows_b)
+    rows,rows_b = rows[order],rows_b[order]
+
+    # bucket neighbours are within 2 bins so confirm both break points are within slack
+    keep = (np.abs(pos1[rows] - pos1_b[rows_b]) <= slack) & (np.abs(pos2[rows] - pos2_b[rows_b]) <= slack)
+    rows,rows_b = rows[keep],rows_b[keep]
+    dfMatch = df1.iloc[rows].reset_index(drop = True)
+    dfMatch_b = df2.iloc[rows_b].reset_index(drop = True)
+    dfMatch_b.columns = [column + '_b' for column in dfMatch_b.columns]
+    return(pd.concat([dfMatch,dfMatch_b],axis=1))
+# **
+
+# ** match intrachrom paired BEs on both break points then measure the overlap of their [pos1,pos2] spans **
+# candidates come from slack windows around the break points so their number follows local break point density
+# rather than sv length - spans are kept and rows come back the way a pyranges join of [pos1 - 1,pos2) reports them
+def matchSpans(df1,df2,slack=200):
+    dfMatch = matchBreakends(df1.assign(row = np.arange(len(df1))),df2.assign(row = np.arange(len(df2))),slack)
+    start,end = dfMatch['pos1'].to_numpy() - 1,dfMatch['pos2'].to_numpy()
+    start_b,end_b = dfMatch['pos1_b'].to_numpy() - 1,dfMatch['pos2_b'].to_numpy()
+    dfMatch['Overlap'] = np.minimum(end,end_b) - np.maximum(start,start_b)
+
+    # reciprical overlap is the overlap over the larger span
+    dfMatch['ro'] = dfMatch['Overlap'] / np.maximum(end - start,end_b - start_b)
+    dfMatch['diff1'] = abs(dfMatch['pos1'] - dfMatch['pos1_b'])
+    dfMatch['diff2'] = abs(dfMatch['pos2'] - dfMatch['pos2_b'])
+    keep = (start < end_b) & (start_b < end)
+    order = np.lexsort((dfMatch['row_b'].to_numpy()[keep],-end_b[keep],start_b[keep],dfMatch['row'].to_numpy()[keep]))
+    return(dfMatch[keep].iloc[order].drop(columns = ['row','row_b']).reset_index(drop = True))
+# **
+
+# ** natural chromosome order (chr1,chr2,chr10,chrX) - the order pyranges reports chromosomes in **
+def naturalKey(chrom):
+    return [int(token) if token.isdigit() else token for token in re.split(r'([0-9]+)',chrom)]
+# **
+
+# ** split paired BEs of two tables into shards sharing the key columns (chrom1 or chrom1,chrom2) **
+# only shards present in both tables can match - shards are listed in natural chromosome order
+# df2 of None pairs each shard of df1 with itself
+def shardPairs(df1,df2,keys):
+    groups1 = dict(list(df1.groupby(keys,sort = False)))
+    groups2 = groups1 if df2 is None or df2 is df1 else dict(list(df2.groupby(keys,sort = False)))
+    shared = sorted([key for key in groups1 if key in groups2],key = lambda key: [naturalKey(chrom) for chrom in key])
+    return([(groups1[key],groups2[key]) for key in shared])
+# **
+
+# ** run a matching function over shards - in worker processes when jobs > 1 **
+# results come back in shard order so merged output does not depend on the number of jobs
+def runShards(function,shards,args,jobs = 1):
+    if jobs > 1 and len(shards) > 1:
+        wait_for_writes()  # background table writes must not be in flight when workers are forked
+        with ProcessPoolExecutor(max_workers = min(jobs,len(shards))) as executor:
+            futures = [executor.submit(function,*shard,*args) for shard in shards]
+            return([future.result() for future in futures])
+    return([function(*shard,*args) for shard in shards])
+# **
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# coordinate sorted, bgzipped and indexed vcf output
+# records are sorted in bounded memory by spilling sorted runs to disk and merging them, then written as BGZF blocks
+# while the tabix (.tbi) or coordinate sorted (.csi) index is built in the same pass
+
+import numpy as np
+import zlib,struct,heapq,tempfile
+
+# uncompressed bytes per BGZF block - the htslib default so blocks always fit in 64KB when deflated
+block_size = 0xff00
+
+# empty block that marks the end of a BGZF file
+bgzf_eof = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+# binning scheme shared by tbi and csi indexes - 16kb windows and 5 levels cover 512Mb contigs
+min_shift,depth = 14,5
+
+# *** BGZF output - state is the open file, the uncompressed block being filled and the offset of that block ***
+def bgzf_open(out_file,level = 6):
+    return {'out':open(out_file,'wb'),'buffer':bytearray(),'address':0,'level':level}
+
+# ** virtual offset of the next byte written - compressed block offset and offset within the uncompressed block **
+def bgzf_tell(bgzf):
+    return (bgzf['address'] << 16) | len(bgzf['buffer'])
+# **
+
+# ** deflate the current block with the BC extra field giving the block size **
+def bgzf_flush(bgzf):
+    if len(bgzf['buffer']) == 0:
+        return
+    compressor = zlib.compressobj(bgzf['level'],zlib.DEFLATED,-15)
+    deflated = compressor.compress(bytes(bgzf['buffer'])) + compressor.flush()
+    block = struct.pack('<4BI2BH2BHH',31,139,8,4,0,0,255,6,66,67,2,len(deflated) + 25) + deflated + struct.pack('<II',zlib.crc32(bgzf['buffer']),len(bgzf['buffer']))
+    bgzf['out'].write(block)
+    bgzf['address'] += len(block)
+    bgzf['buffer'].clear()
+# **
+
+# ** a line starts a new block when it does not fit in the current one so records are rarely split across blocks **
+# returns the virtual offset the data starts at
+def bgzf_write(bgzf,data):
+    if len(bgzf['buffer']) + len(data) > block_size:
+        bgzf_flush(bgzf)
+    voffset = bgzf_tell(bgzf)
+    while len(data) > 0:
+        size = block_size - len(bgzf['buffer'])
+        bgzf['buffer'] += data[:size]
+        data = data[size:]
+        if len(bgzf['buffer']) == block_size:
+            bgzf_flush(bgzf)
+    return voffset
+# **
+
+def bgzf_close(bgzf):
+    bgzf_flush(bgzf)
+    bgzf['out'].write(bgzf_eof)
+    bgzf['out'].close()
+# ***
+
+# *** tabix style index built record by record - contigs are added in the order they appear ***
+# ** bin of a 0-based half open interval **
+def reg2bin(beg,end):
+    end -= 1
+    shift,first = min_shift,((1 << depth * 3) - 1) // 7
+    for level in range(depth,0,-1):
+        if beg >> shift == end >> shift:
+            return first + (beg >> shift)
+        shift += 3
+        first -= 1 << (level - 1) * 3
+    return 0
+# **
+
+# ** first 16kb window covered by a bin **
+def bin2window(bin):
+    level,first = 0,0
+    while bin >= first + (1 << level * 3):
+        first += 1 << level * 3
+        level += 1
+    return (bin - first) << (depth - level) * 3
+# **
+
+def index_record(index,chrom,beg,end,voffset_beg,voffset_end):
+    if len(index['names']) == 0 or index['names'][-1] != chrom:
+        if chrom in index['names']:
+            raise Exception('i no understand unsorted vcf records on ' + chrom)
+        index['names'].append(chrom)
+        index['refs'].append({'bins':dict(),'linear':[],'begin':voffset_beg,'end':voffset_end,'mapped':0})
+    ref = index['refs'][-1]
+
+    # chunks of a bin are extended while they follow on from the previous record or continue in the same block
+    chunks = ref['bins'].setdefault(reg2bin(beg,end),[])
+    if len(chunks) > 0 and (chunks[-1][1] == ref['end'] or chunks[-1][1] >> 16 >= voffset_beg >> 16):
+        chunks[-1][1] = voffset_end
+    else:
+        chunks.append([voffset_beg,voffset_end])
+
+    # linear index holds the first record overlapping each window
+    last = (end - 1) >> min_shift
+    if len(ref['linear']) <= last:
+        ref['linear'].extend([0] * (last + 1 - len(ref['linear'])))
+    for window in range(beg >> min_shift,last + 1):
+        if ref['linear'][window] == 0:
+            ref['linear'][window] = voffset_beg
+    ref['end'] = voffset_end
+    ref['mapped'] += 1
+
+# ** finish the linear index and add the pseudo bin holding the contig offsets and record count **
+def finish_refs(index):
+    pseudo = ((1 << (depth + 1) * 3) - 1) // 7 + 1
+    for ref in index['refs']:
+        for window in range(1,len(ref['linear'])):
+            if ref['linear'][window] == 0:
+                ref['linear'][window] = ref['linear'][window - 1]
+        ref['bins'][pseudo] = [[ref['begin'],ref['end']],[ref['mapped'],0]]
+    return pseudo
+# **
+
+# ** write a tbi or csi index - both are BGZF compressed and carry the vcf preset of tabix **
+def write_index(index,index_file,kind):
+    pseudo = finish_refs(index)
+    names = b''.join([name.encode() + b'\x00' for name in index['names']])
+    conf = struct.pack('<7i',2,1,2,0,ord('#'),0,len(names)) + names  # vcf format, chrom and pos columns, meta char, skip, names
+    if kind == 'tbi':
+        data = [b'TBI\x01',struct.pack('<i',len(index['refs'])),conf]
+    else:
+        data = [b'CSI\x01',struct.pack('<3i',min_shift,depth,len(conf)),conf,struct.pack('<i',len(index['refs']))]
+
+    for ref in index['refs']:
+        data.append(struct.pack('<i',len(ref['bins'])))
+        for bin in sorted(ref['bins']):
+            chunks = ref['bins'][bin]
+            if kind == 'tbi':
+                data.append(struct.pack('<Ii',bin,len(chunks)))
+            else:
+                # csi keeps the first record overlapping the start of a bin in place of the linear index
+                window = bin2window(bin) if bin != pseudo else 0
+                loffset = 0 if bin == pseudo or len(ref['linear']) == 0 else ref['linear'][min(window,len(ref['linear']) - 1)]
+                data.append(struct.pack('<IQi',bin,loffset,len(chunks)))
+            data.append(struct.pack('<' + 'Q' * 2 * len(chunks),*[offset for chunk in chunks for offset in chunk]))
+        if kind == 'tbi':
+            data.append(struct.pack('<i',len(ref['linear'])) + struct.pack('<' + 'Q' * len(ref['linear']),*ref['linear']))
+    data.append(struct.pack('<Q',0))  # no records without coordinates
+
+    bgzf = bgzf_open(index_file)
+    bgzf_write(bgzf,b''.join(data))
+    bgzf_close(bgzf)
+# **
+# ***
+
+# *** external sort - chunks of vcf lines are sorted in memory and spilled as runs, then merged while writing ***
+# state is the temporary directory of runs and the contig rank used as the sort key
+def sort_open(out_dir,contigs):
+    return {'dir':tempfile.TemporaryDirectory(dir = out_dir,prefix = '.sort-'),'runs':[],'rank':{chrom:idx for idx,chrom in enumerate(contigs)}}
+
+# ** sort one chunk of lines by contig rank and position - ties keep table order **
+def sort_chunk(sorter,lines,chroms,positions):
+    ranks = np.array([sorter['rank'][chrom] for chrom in chroms],dtype = np.int64)
+    run = sorter['dir'].name + '/run' + str(len(sorter['runs'])) + '.vcf'
+    with open(run,'w') as out1:
+        out1.write(''.join(lines[np.lexsort((positions,ranks))]))
+    sorter['runs'].append(run)
+# **
+
+# ** contig rank and position of a vcf line **
+def line_key(sorter,line):
+    chrom,pos,rest = line.split('\t',2)
+    return (sorter['rank'][chrom],int(pos))
+# **
+
+# *** merge sorted runs into a bgzipped vcf and index it in the same pass ***
+# heapq.merge keeps earlier runs first among ties so the output is the same as a stable sort of the whole table
+def sort_write(sorter,out_file,header,kind):
+    bgzf = bgzf_open(out_file)
+    bgzf_write(bgzf,header.encode())
+    index = {'names':[],'refs':[]}
+    runs = [open(run) for run in sorter['runs']]
+    for line in heapq.merge(*runs,key = lambda line: line_key(sorter,line)):
+        chrom,pos,id,ref,rest = line.split('\t',4)
+        voffset_beg = bgzf_write(bgzf,line.encode())
+        index_record(index,chrom,int(pos) - 1,int(pos) - 1 + len(ref),voffset_beg,bgzf_tell(bgzf))
+    for in1 in runs:
+        in1.close()
+    bgzf_close(bgzf)
+    sorter['dir'].cleanup()
+    write_index(index,out_file + '.' + kind,kind)
+# ***